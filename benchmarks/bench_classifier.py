@@ -0,0 +1,82 @@
+"""文件名分类器微基准：逐条 re.search（旧实现） vs 预编译单次匹配的 FilenameClassifier
+
+用法: python benchmarks/bench_classifier.py [名称数量] [重复次数]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import monitor_worker as mw  # noqa: E402
+
+TEMPLATES = [
+    "OK影视Pro-电视版-32位-{v}.apk",
+    "OK影视Pro-电视版-64位-{v}.apk",
+    "OK影视Pro-手机版-{v}.apk",
+    "OK影视Pro-手机版-{v} - 模拟器.apk",
+    "海信专版-OK影视-{v}.apk",
+    "OK影视-电视版-{v}.apk",
+    "OK影视-手机版-{v}.apk",
+    "OK影视-手机版-{v}-内测.apk",
+    "其他应用-{v}.apk",
+    "更新说明-{v}.txt",
+    "README {v}.md",
+    "素材/封面-{v}.png",
+]
+
+
+def synthetic_listing(n, seed=42):
+    rnd = random.Random(seed)
+    names = []
+    for _ in range(n):
+        v = f"{rnd.randint(1, 9)}.{rnd.randint(0, 20)}.{rnd.randint(0, 99)}"
+        name = rnd.choice(TEMPLATES).format(v=v)
+        if rnd.random() < 0.2:
+            name = "备份-" + "x" * rnd.randint(1, 40) + "-" + name
+        names.append(name)
+    return names
+
+
+# 旧实现：先 Pro 规则再标准版规则逐条 re.search
+def legacy_target(name):
+    for rename_map in (mw.PRO_RENAME_MAP, mw.OK_RENAME_MAP):
+        for pattern, new_name in rename_map.items():
+            if re.search(pattern, name):
+                return new_name
+    return name.replace(".apk", "").replace(" ", "_").replace("/", "_") + ".apk"
+
+
+def bench(fn, names, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for name in names:
+            fn(name)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    names = synthetic_listing(n)
+    classifier = mw.FilenameClassifier([("pro", mw.PRO_RENAME_MAP), ("ok", mw.OK_RENAME_MAP)])
+
+    mismatches = [name for name in names if legacy_target(name) != classifier.target_name(name)]
+    if mismatches:
+        print(f"结果不一致 {len(mismatches)} 条，例如: {mismatches[:3]}")
+        sys.exit(1)
+
+    legacy = bench(legacy_target, names, repeat)
+    compiled = bench(classifier.target_name, names, repeat)
+    print(f"名称数: {n}, 规则数: {len(classifier.rules)}, 重复: {repeat}（取最快一次）")
+    print(f"逐条 re.search : {legacy * 1000:8.2f} ms  ({n / legacy:,.0f} 条/秒)")
+    print(f"FilenameClassifier: {compiled * 1000:8.2f} ms  ({n / compiled:,.0f} 条/秒)")
+    print(f"加速比: {legacy / compiled:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
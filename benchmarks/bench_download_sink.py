@@ -0,0 +1,129 @@
+"""下载写入微基准：iter_content(8192) + 每块 tqdm.update（旧实现） vs readinto 复用缓冲区的 pump
+
+本地 HTTP 服务运行在独立子进程中，只统计客户端进程的 CPU 时间。每种方式都写入临时文件并计算 sha256，
+与实际下载路径的工作量一致。
+
+用法: python benchmarks/bench_download_sink.py [大小MB] [重复次数]
+"""
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import monitor_worker as mw  # noqa: E402
+
+
+def serve(port, size):
+    body = memoryview(bytes(range(256)) * (size // 256 + 1))[:size]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", str(size))
+            self.send_header("Content-Type", "application/vnd.android.package-archive")
+            self.end_headers()
+            for i in range(0, size, 1024 * 1024):
+                self.wfile.write(body[i:i + 1024 * 1024])
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(server.server_address[1], flush=True)
+    server.serve_forever()
+
+
+# 旧实现：逐 8 KiB 块写文件、算哈希、刷新进度条
+def legacy(session, url, path):
+    from tqdm import tqdm
+
+    sha = hashlib.sha256()
+    with session.get(url, stream=True) as r, open(path, "wb") as f, \
+            tqdm(total=int(r.headers.get("content-length", 0)), unit="B", unit_scale=True,
+                 file=open(os.devnull, "w")) as pbar:
+        for chunk in r.iter_content(chunk_size=8192):
+            if chunk:
+                f.write(chunk)
+                sha.update(chunk)
+                pbar.update(len(chunk))
+    return sha.hexdigest()
+
+
+def make_pumped(show_progress):
+    def pumped(session, url, path):
+        sha = hashlib.sha256()
+        with session.get(url, stream=True) as r, open(path, "wb", buffering=0) as f, \
+                mw.Progress("bench", int(r.headers.get("content-length", 0)), enabled=show_progress,
+                            file=open(os.devnull, "w")) as pbar:
+            def sink(view, offset):
+                sha.update(view)
+                while view:
+                    view = view[f.write(view):]
+
+            mw.pump(r, sink, pbar)
+        return sha.hexdigest()
+    return pumped
+
+
+def bench(fn, session, url, path, repeat):
+    best_wall, best_cpu, digest = float("inf"), float("inf"), None
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        digest = fn(session, url, path)
+        best_wall = min(best_wall, time.perf_counter() - wall)
+        best_cpu = min(best_cpu, time.process_time() - cpu)
+    return best_wall, best_cpu, digest
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    size = size_mb * 1024 * 1024
+
+    import requests
+
+    server = subprocess.Popen([sys.executable, __file__, "--serve", str(size)], stdout=subprocess.PIPE, text=True)
+    try:
+        url = f"http://127.0.0.1:{int(server.stdout.readline())}/apk"
+        session = requests.Session()
+        expected = hashlib.sha256((bytes(range(256)) * (size // 256 + 1))[:size]).hexdigest()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "out.apk")
+            cases = [
+                ("iter_content(8192)+tqdm", legacy),
+                ("pump+节流进度条", make_pumped(True)),
+                ("pump 无进度条", make_pumped(False)),
+            ]
+            results = []
+            for label, fn in cases:
+                wall, cpu, digest = bench(fn, session, url, path, repeat)
+                if digest != expected or os.path.getsize(path) != size:
+                    print(f"{label}: 内容校验失败")
+                    sys.exit(1)
+                results.append((label, wall, cpu))
+    finally:
+        server.terminate()
+        server.wait()
+
+    gb = size / 1024 ** 3
+    print(f"大小: {size_mb} MB, 重复: {repeat}（取最快一次），CHUNK_MAX={mw.CHUNK_MAX // 1024} KiB")
+    print(f"{'方式':<26}{'MB/s':>10}{'CPU s/GB':>12}")
+    for label, wall, cpu in results:
+        print(f"{label:<26}{size_mb / wall:>10.1f}{cpu / gb:>12.2f}")
+    base_cpu = results[0][2]
+    for label, _, cpu in results[1:]:
+        print(f"{label} CPU 降低: {(1 - cpu / base_cpu) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--serve":
+        serve(0, int(sys.argv[2]))
+    else:
+        main()
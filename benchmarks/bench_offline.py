@@ -0,0 +1,144 @@
+"""离线端到端基准：对本地替身服务运行 monitor_worker.py，输出可在版本之间对比的数字
+
+每个场景启动一个 FakeQuark，在临时目录里以 --full 模式运行脚本若干次，记录耗时中位数、各接口请求数、
+注入的错误数、传输字节数以及脚本自身运行报告中的阶段耗时。
+
+用法: python benchmarks/bench_offline.py [场景 ...] [--repeat N] [--latency 秒] [--bandwidth 字节/秒]
+                                         [--error-rate 比例] [--seed N] [--env KEY=VALUE ...] [--json 输出文件]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+SCRIPT = os.path.join(ROOT, "monitor_worker.py")
+
+sys.path.insert(0, HERE)
+
+from fake_quark import SCENARIOS, FakeQuark  # noqa: E402
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def run_once(fake, base_url, extra_env, workdir):
+    env = dict(os.environ)
+    env.update(fake.env(base_url))
+    env.update({
+        "MONITOR_STATE_DIR": os.path.join(workdir, ".monitor_state"),
+        "ARTIFACT_DIR": os.path.join(workdir, ".artifacts"),
+        "GITHUB_OUTPUT": "",
+    })
+    env.update(extra_env)
+    fake.reset_stats()
+    start = time.perf_counter()
+    with open(os.path.join(workdir, "output.log"), "w", encoding="utf-8") as log:
+        proc = subprocess.run(
+            [sys.executable, SCRIPT, "--full", "--metrics-json", "report.json"],
+            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    elapsed = time.perf_counter() - start
+    report = {}
+    try:
+        with open(os.path.join(workdir, "report.json"), encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        pass
+    return {
+        "exit_code": proc.returncode,
+        "elapsed_s": elapsed,
+        "server": json.loads(json.dumps(fake.stats)),
+        "spans": {k: v["total_s"] for k, v in report.get("spans", {}).items()},
+    }
+
+
+def run_scenario(name, args, extra_env):
+    fake = FakeQuark(name, seed=args.seed, latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate)
+    base_url = fake.start()
+    runs = []
+    try:
+        for i in range(args.repeat):
+            with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as workdir:
+                result = run_once(fake, base_url, extra_env, workdir)
+                if result["exit_code"] not in (0, 3):
+                    with open(os.path.join(workdir, "output.log"), encoding="utf-8") as f:
+                        tail = f.read()[-2000:]
+                    print(f"  第 {i + 1} 次运行退出码 {result['exit_code']}，输出末尾:\n{tail}")
+            runs.append(result)
+            print(f"  第 {i + 1} 次: {result['elapsed_s']:.2f}s, 请求 {sum(result['server']['requests'].values())}, "
+                  f"传输 {result['server']['bytes_served'] / 1024 / 1024:.1f} MB")
+    finally:
+        fake.stop()
+    times = [r["elapsed_s"] for r in runs]
+    last = runs[-1]
+    return {
+        "scenario": name,
+        "desc": SCENARIOS[name]["desc"],
+        "config": {"latency": fake.latency, "bandwidth": fake.bandwidth, "error_rate": fake.error_rate,
+                   "direct_fail": fake.direct_fail, "task_rounds": fake.task_rounds,
+                   "corrupt_rate": fake.corrupt_rate, "seed": args.seed},
+        "median_s": statistics.median(times),
+        "min_s": min(times),
+        "max_s": max(times),
+        "exit_codes": sorted({r["exit_code"] for r in runs}),
+        "requests": last["server"]["requests"],
+        "injected_errors": last["server"]["injected_errors"],
+        "corrupted": last["server"]["corrupted"],
+        "bytes_served": last["server"]["bytes_served"],
+        "throughput_mb_s": last["server"]["bytes_served"] / 1024 / 1024 / statistics.median(times),
+        "spans": last["spans"],
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="离线端到端基准")
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help=f"场景，可选: {', '.join(SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=None, help="接口延迟（秒），默认按场景")
+    parser.add_argument("--bandwidth", type=int, default=None, help="单连接带宽（字节/秒），0 为不限")
+    parser.add_argument("--error-rate", type=float, default=None, help="接口与文件请求注入 503 的比例")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--env", action="append", default=[], help="传给被测脚本的环境变量，如 DOWNLOAD_RATE=0")
+    parser.add_argument("--json", help="将结果写入 JSON 文件，便于版本间对比")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        print(f"未知场景: {', '.join(unknown)}")
+        return 2
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    revision = git_revision()
+    results = []
+    for name in args.scenarios:
+        print(f"=== {name}: {SCENARIOS[name]['desc']} ===")
+        results.append(run_scenario(name, args, extra_env))
+
+    print(f"\n版本 {revision}，每个场景 {args.repeat} 次（取中位数）")
+    print(f"{'场景':<18}{'中位数(s)':>10}{'最小(s)':>9}{'请求数':>8}{'注入错误':>9}{'MB/s':>9}  退出码")
+    for r in results:
+        print(f"{r['scenario']:<18}{r['median_s']:>10.2f}{r['min_s']:>9.2f}{sum(r['requests'].values()):>8}"
+              f"{r['injected_errors']:>9}{r['throughput_mb_s']:>9.1f}  {r['exit_codes']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"revision": revision, "env": extra_env, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+    return 0 if all(set(r["exit_codes"]) <= {0, 3} for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
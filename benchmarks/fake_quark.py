@@ -0,0 +1,419 @@
+"""本地夸克 / Worker 替身服务，供离线基准测试使用
+
+提供 sharepage/token、Worker 分页列表、file/download、sharepage/save、task 轮询、file/delete、file/sort
+以及支持 Range 的文件内容，可配置接口延迟、单连接带宽、错误注入和损坏的文件内容。错误注入按
+(接口, 键, 第几次请求) 的哈希决定，同一场景多次运行结果一致。tests/ 中的 pytest 检查也使用它。
+
+单独启动: python benchmarks/fake_quark.py [场景名] [端口]
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import monitor_worker as mw  # noqa: E402
+
+PRO_DIR, OK_DIR = mw.TARGET_DIRS
+CHUNK = 64 * 1024
+PATTERN = bytes(range(256)) * (CHUNK // 256)
+CHANGELOG = "版本 v1.0\n更新日志:\n- 修复若干问题，提升稳定性\n- 新增功能\n".encode("utf-8")
+EOCD_SIZE = 22
+KB, MB = 1024, 1024 * 1024
+
+
+def pro_apks(version, size):
+    return [
+        (f"OK影视Pro-电视版-32位-{version}.apk", size),
+        (f"OK影视Pro-电视版-64位-{version}.apk", size),
+        (f"OK影视Pro-手机版-{version}.apk", size),
+        (f"OK影视Pro-手机版-{version} - 模拟器.apk", size),
+    ]
+
+
+def ok_apks(version, size):
+    return [
+        (f"海信专版-OK影视-{version}.apk", size),
+        (f"OK影视-电视版-{version}.apk", size),
+        (f"OK影视-手机版-{version}.apk", size),
+    ]
+
+
+# 场景：pro 为 Pro 目录文件，ok 为标准版最新子目录文件，ok_folders 为标准版目录下的版本子目录数，
+# env 为运行被测脚本时附加的环境变量，其余键覆盖 FakeQuark 的默认参数
+SCENARIOS = {
+    "baseline": {
+        "desc": "标准目录结构：Pro 4 个 + 标准版 3 个 APK，各 2 MB",
+        "pro": pro_apks("1.0", 2 * MB) + [("Pro版更新说明.txt", 0)],
+        "ok": ok_apks("3.2", 2 * MB) + [("更新说明.txt", 0)],
+        "ok_folders": 3,
+    },
+    "small-files": {
+        "desc": "Pro 目录 200 个 64 KB 的 APK",
+        "pro": [(f"插件-{i:03d}.apk", 64 * KB) for i in range(200)],
+        "ok": ok_apks("3.2", 64 * KB),
+        "ok_folders": 2,
+        "env": {"DOWNLOAD_RATE": "0"},  # 关闭令牌桶限速，衡量调度与单文件开销
+    },
+    "huge-apks": {
+        "desc": "少量 96 MB 的 APK（走分段下载）",
+        "pro": pro_apks("1.0", 96 * MB)[:2],
+        "ok": ok_apks("3.2", 96 * MB)[:1],
+        "ok_folders": 1,
+        "bandwidth": 64 * MB,
+    },
+    "deep-pagination": {
+        "desc": "Pro 目录 3000 个条目（仅 4 个 APK），标准版 400 个版本子目录",
+        "pro": pro_apks("1.0", 256 * KB) + [(f"素材-{i:04d}.png", 10 * KB) for i in range(2996)],
+        "ok": ok_apks("3.2", 256 * KB),
+        "ok_folders": 400,
+        "latency": 0.05,
+    },
+    "flaky-transfers": {
+        "desc": "分享直链全部失败需转存，接口 20% 概率 503，转存任务需多轮轮询",
+        "pro": pro_apks("1.0", 1 * MB),
+        "ok": ok_apks("3.2", 1 * MB),
+        "ok_folders": 2,
+        "direct_fail": True,
+        "error_rate": 0.2,
+        "task_rounds": 4,
+    },
+    "bad-bodies": {
+        "desc": "半数 APK 首次下载返回错误页或缺少中央目录的内容，校验失败后重试",
+        "pro": pro_apks("1.0", 2 * MB),
+        "ok": ok_apks("3.2", 2 * MB),
+        "ok_folders": 1,
+        "corrupt_rate": 0.5,
+    },
+}
+
+
+def entry(name, fid, size, is_dir=False):
+    return {
+        "fid": fid,
+        "file_name": name,
+        "dir": is_dir,
+        "file_type": 0 if is_dir else 1,
+        "size": size,
+        "share_fid_token": "tk_" + fid,
+        "updated_at": 1700000000000,
+        "last_update_at": 1700000000000,
+    }
+
+
+# 伪 APK 内容：本地文件头 + 固定填充 + 空的中央目录结束记录，任意区间可按偏移生成
+def body_slice(size, start, end):
+    head = b"PK\x03\x04"
+    eocd = b"PK\x05\x06" + b"\x00" * 8 + (0).to_bytes(4, "little") + (size - EOCD_SIZE).to_bytes(4, "little") + b"\x00\x00"
+    out = bytearray()
+    pos = start
+    while pos <= end:
+        if pos < len(head):
+            out += head[pos:min(len(head), end + 1)]
+            pos = min(len(head), end + 1)
+        elif pos >= size - EOCD_SIZE:
+            out += eocd[pos - (size - EOCD_SIZE):end + 1 - (size - EOCD_SIZE)]
+            pos = end + 1
+        else:
+            stop = min(end + 1, size - EOCD_SIZE, pos - pos % CHUNK + CHUNK)
+            out += PATTERN[pos % CHUNK:pos % CHUNK + (stop - pos)]
+            pos = stop
+    return bytes(out)
+
+
+class FakeQuark:
+    # 参数优先级：显式传入 > 场景定义 > DEFAULTS
+    DEFAULTS = {"latency": 0.02, "bandwidth": 0, "error_rate": 0.0, "direct_fail": False, "task_rounds": 2,
+                "corrupt_rate": 0.0, "save_drop": 0}
+
+    def __init__(self, scenario="baseline", seed=0, **overrides):
+        spec = SCENARIOS[scenario] if isinstance(scenario, str) else scenario
+        for key, default in self.DEFAULTS.items():
+            value = overrides.get(key)
+            setattr(self, key, value if value is not None else spec.get(key, default))
+        self.seed = seed
+        self.script_env = dict(spec.get("env", {}))
+        self.stoken = "BENCH_STOKEN"
+        self.lock = threading.Lock()
+        self.dirs, self.files = self._build(spec)
+        self.tasks = {}
+        self.attempts = {}
+        self.corrupt = {}
+        self.broken = set()  # 这些 fid 的文件请求一律返回 404（模拟失效的链接）
+        self.broken_pages = set()  # 这些 (目录 fid, 页码) 的列表请求一律返回 503
+        self.deleted = []
+        self.reset_stats()
+        self.server = None
+
+    def _build(self, spec):
+        dirs = {PRO_DIR: [], OK_DIR: []}
+        for i, (name, size) in enumerate(spec.get("pro", [])):
+            dirs[PRO_DIR].append(entry(name, f"pro{i:05d}", size or len(CHANGELOG)))
+        folders = max(1, spec.get("ok_folders", 1))
+        for n in range(folders):
+            fid = f"okdir{n:04d}"
+            dirs[OK_DIR].append(entry(f"3.{n}.0", fid, 0, is_dir=True))
+            dirs[fid] = []
+        latest = f"okdir{folders - 1:04d}"
+        for i, (name, size) in enumerate(spec.get("ok", [])):
+            dirs[latest].append(entry(name, f"ok{i:05d}", size or len(CHANGELOG)))
+        files = {f["fid"]: f for items in dirs.values() for f in items if not f["dir"]}
+        return dirs, files
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {"requests": {}, "injected_errors": 0, "bytes_served": 0, "corrupted": 0}
+            self.attempts = {}
+            self.tasks = {}
+            self.deleted = []
+            self.corrupt = self._pick_corrupt()
+
+    # 按 corrupt_rate 选出首次下载内容损坏的 APK：一半返回 HTML 错误页，一半抹掉中央目录结束记录
+    def _pick_corrupt(self):
+        picked = {}
+        for fid, f in self.files.items():
+            if not f["file_name"].endswith(".apk"):
+                continue
+            digest = hashlib.sha256(f"{self.seed}:corrupt:{fid}".encode()).digest()
+            if int.from_bytes(digest[:4], "big") / 2 ** 32 < self.corrupt_rate:
+                picked[fid] = "html" if digest[4] % 2 else "truncated"
+        return picked
+
+    # 本次请求是否应返回损坏内容；每个文件只损坏一次
+    def take_corruption(self, fid, start, end, size):
+        with self.lock:
+            mode = self.corrupt.get(fid)
+            if mode == "truncated" and end != size - 1:
+                return None  # 只有包含文件末尾的请求才会带上中央目录结束记录
+            if mode:
+                del self.corrupt[fid]
+                self.stats["corrupted"] += 1
+            return mode
+
+    def count(self, endpoint):
+        with self.lock:
+            self.stats["requests"][endpoint] = self.stats["requests"].get(endpoint, 0) + 1
+
+    # 对同一 (接口, 键) 的前两次请求按错误率确定性地注入 503，保证重试最终能成功
+    def should_fail(self, endpoint, key):
+        if self.error_rate <= 0:
+            return False
+        with self.lock:
+            n = self.attempts.get((endpoint, key), 0)
+            self.attempts[(endpoint, key)] = n + 1
+        if n >= 2:
+            return False
+        digest = hashlib.sha256(f"{self.seed}:{endpoint}:{key}:{n}".encode()).digest()
+        failed = int.from_bytes(digest[:4], "big") / 2 ** 32 < self.error_rate
+        if failed:
+            with self.lock:
+                self.stats["injected_errors"] += 1
+        return failed
+
+    def content(self, fid):
+        f = self.files.get(fid)
+        if f is None or fid in self.broken:
+            return None, 0
+        if f["file_name"].endswith(".txt"):
+            return CHANGELOG, len(CHANGELOG)
+        return None, f["size"]
+
+    def start(self, port=0):
+        fake = self
+
+        class Handler(_Handler):
+            server_state = fake
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    # 运行被测脚本所需的环境变量
+    def env(self, base_url):
+        return {
+            **self.script_env,
+            "QUARK_WORKER_URL": f"{base_url}/worker",
+            "QUARK_DRIVE_PC_API": base_url,
+            "QUARK_DRIVE_API": base_url,
+            "QUARK_COOKIE": "bench=1",
+            "QUARK_STOKEN": self.stoken,
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, obj, code=200):
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _unavailable(self):
+        self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _api(self, endpoint, key=""):
+        fake = self.server_state
+        fake.count(endpoint)
+        if fake.latency:
+            time.sleep(fake.latency)
+        if fake.should_fail(endpoint, key):
+            self._unavailable()
+            return False
+        return True
+
+    def do_POST(self):
+        fake = self.server_state
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path
+        if path.startswith("/worker"):
+            pdir, page, size = body.get("pdir_fid", ""), int(body.get("_page", 1)), int(body.get("_size", 50))
+            if not self._api("list", f"{pdir}:{page}"):
+                return
+            if (pdir, page) in fake.broken_pages:
+                return self._unavailable()
+            items = fake.dirs.get(pdir, [])
+            return self._json({
+                "code": 0,
+                "data": {"detail_info": {"list": items[(page - 1) * size:page * size]}},
+                "metadata": {"_total": len(items), "_page": page, "_size": size},
+            })
+        if "sharepage/token" in path:
+            if self._api("token"):
+                self._json({"code": 0, "data": {"stoken": fake.stoken, "title": "bench"}})
+            return
+        if "file/download" in path:
+            fids = body.get("fids", [])
+            if not self._api("download_link", ",".join(fids)):
+                return
+            if fake.direct_fail and body.get("stoken"):
+                return self._json({"code": 0, "data": []})
+            base = f"http://{self.headers.get('Host')}"
+            return self._json({"code": 0, "data": [
+                {"fid": fid, "download_url": f"{base}/f/{fid[2:] if fid.startswith('L_') else fid}"} for fid in fids
+            ]})
+        if "sharepage/save" in path:
+            if not self._api("save", ",".join(body.get("fid_list", []))):
+                return
+            with fake.lock:
+                task_id = f"task{len(fake.tasks) + 1}"
+                fake.tasks[task_id] = [body.get("fid_list", []), 0]
+            return self._json({"code": 0, "data": {"task_id": task_id}})
+        if "file/delete" in path:
+            if self._api("delete", ",".join(body.get("filelist", []))):
+                with fake.lock:
+                    fake.deleted.extend(body.get("filelist", []))
+                self._json({"code": 0, "data": {}})
+            return
+        self._json({"code": 404}, 404)
+
+    def do_GET(self):
+        fake = self.server_state
+        path = self.path
+        if "/clouddrive/task" in path:
+            task_id = path.split("task_id=")[1].split("&")[0]
+            if not self._api("task", path):
+                return
+            with fake.lock:
+                task = fake.tasks.get(task_id)
+                if task:
+                    task[1] += 1
+            if not task:
+                return self._json({"code": 32003, "message": "task not found"})
+            if task[1] < fake.task_rounds:
+                return self._json({"code": 0, "data": {"status": 1}})
+            top_fids = ["L_" + x for x in task[0]]
+            top_fids = top_fids[:max(0, len(top_fids) - fake.save_drop)]  # save_drop: 模拟结果数量与请求不符
+            return self._json({"code": 0, "data": {"status": 2, "save_as": {"save_as_top_fids": top_fids}}})
+        if "file/sort" in path:
+            if self._api("sort"):
+                self._json({"code": 0, "data": {"list": []}})
+            return
+        if path.startswith("/f/"):
+            return self._file(path[3:])
+        self._json({"code": 404}, 404)
+
+    def _file(self, fid):
+        fake = self.server_state
+        fake.count("file")
+        data, size = fake.content(fid)
+        if not size:
+            return self._json({"code": 404}, 404)
+        rng = self.headers.get("Range")
+        if fake.should_fail("file", f"{fid}:{rng}"):
+            return self._unavailable()
+        start, end, code = 0, size - 1, 200
+        if rng:
+            a, b = rng.split("=")[1].split("-")
+            start, end, code = int(a), min(int(b) if b else size - 1, size - 1), 206
+        corruption = fake.take_corruption(fid, start, end, size)
+        if corruption == "html":
+            page = b"<html><body>403 Forbidden</body></html>"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(page)))
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.end_headers()
+            self.wfile.write(page)
+            return
+        self.send_response(code)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Type", "text/plain" if data else "application/vnd.android.package-archive")
+        if code == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        began = time.monotonic()
+        sent = 0
+        pos = start
+        while pos <= end:
+            stop = min(end, pos + CHUNK - 1)
+            chunk = data[pos:stop + 1] if data else body_slice(size, pos, stop)
+            if corruption == "truncated" and stop > size - 1 - EOCD_SIZE:
+                keep = max(0, size - EOCD_SIZE - pos)
+                chunk = chunk[:keep] + b"\x00" * (len(chunk) - keep)
+            try:
+                self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                break
+            sent += len(chunk)
+            pos = stop + 1
+            if fake.bandwidth:
+                ahead = sent / fake.bandwidth - (time.monotonic() - began)
+                if ahead > 0:
+                    time.sleep(ahead)
+        with fake.lock:
+            fake.stats["bytes_served"] += sent
+
+
+if __name__ == "__main__":
+    name = sys.argv[1] if len(sys.argv) > 1 else "baseline"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+    fake = FakeQuark(name)
+    url = fake.start(port)
+    print(f"场景 {name} 已启动: {url}")
+    for key, value in fake.env(url).items():
+        print(f"export {key}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -1,14 +1,29 @@
 import os
+import sys
 import json
-import requests
 import time
 from datetime import datetime
 import threading
 import re
-from tqdm import tqdm
+import random
+import codecs
+import hashlib
+import shutil
+import queue
+import functools
+import argparse
+import signal
+import struct
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
 
 # ===== 配置区 =====
-WORKER_URL = "https://broad-mode-cbfa.sdm607836.workers.dev"
+WORKER_URL = os.getenv("QUARK_WORKER_URL", "https://broad-mode-cbfa.sdm607836.workers.dev")
+DRIVE_PC_API = os.getenv("QUARK_DRIVE_PC_API", "https://drive-pc.quark.cn")  # 可指向本地替身服务做测试
+DRIVE_API = os.getenv("QUARK_DRIVE_API", "https://drive.quark.cn")
 PWD_ID = "cb0ee2b9ac64"  # 你的分享 pwd_id
 PAGE_SIZE = 50
 TARGET_DIRS = [
@@ -16,6 +31,112 @@ TARGET_DIRS = [
     "f0c75c96e96e4310b96383b4b22040e3",  # OK 标准版
 ]
 
+# 列表并发配置
+LIST_WORKERS = int(os.getenv("LIST_WORKERS", "6"))  # 列表请求线程数
+LIST_PREFETCH = int(os.getenv("LIST_PREFETCH", "3"))  # 无总数时每批投机预取的页数
+
+# 并发下载配置
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))  # 下载线程数
+PER_HOST_LIMIT = int(os.getenv("PER_HOST_LIMIT", "2"))  # 单个域名同时下载的文件数（分段下载时每个文件最多 SEGMENT_WORKERS 个连接）
+DOWNLOAD_RATE = float(os.getenv("DOWNLOAD_RATE", "0.5"))  # 每秒允许启动的下载数（替代固定 sleep 4），<=0 不限速
+DOWNLOAD_BURST = int(os.getenv("DOWNLOAD_BURST", "2"))  # 令牌桶容量
+
+# 分段下载配置
+SEGMENT_SIZE = int(os.getenv("SEGMENT_SIZE", str(8 * 1024 * 1024)))  # 每段字节数
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", "4"))  # 单文件并行段数，单个域名的连接数最多为 PER_HOST_LIMIT × SEGMENT_WORKERS
+SEGMENT_MIN_SIZE = int(os.getenv("SEGMENT_MIN_SIZE", str(16 * 1024 * 1024)))  # 小于此大小走单连接
+SEGMENT_RETRIES = 3
+
+# 下载校验：下载前用 1 字节 Range 请求探测大小和类型，下载后校验大小与 APK（zip）中央目录；不合格的文件移入隔离区。
+# 下载或校验失败时丢弃缓存链接，重新获取链接重试 INTEGRITY_RETRIES 次，仍失败则留待下次运行
+DOWNLOAD_PROBE = os.getenv("DOWNLOAD_PROBE", "1") != "0"
+INTEGRITY_RETRIES = int(os.getenv("INTEGRITY_RETRIES", "1"))
+BAD_CONTENT_TYPES = ("text/", "application/json")  # 这些类型的响应体是错误页而不是安装包
+
+# 下载读写：响应体按块 readinto 到每线程复用的缓冲区，块大小在 CHUNK_MIN..CHUNK_MAX 之间自适应。
+# urllib3 的 readinto 内部仍先读出 bytes 再拷入缓冲区，节省的是 iter_content 的小块生成器与逐块进度刷新的开销
+CHUNK_MIN = 64 * 1024
+CHUNK_MAX = int(os.getenv("CHUNK_MAX", str(1024 * 1024)))
+# 进度条：auto 时仅在终端（非 CI）显示；最多每 PROGRESS_INTERVAL 秒刷新一次
+PROGRESS = os.getenv("PROGRESS", "auto")  # auto / on / off
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "0.5"))
+
+# HTTP 客户端配置
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))  # 失败后最多重试次数
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))  # 指数退避基数（秒）
+HTTP_BACKOFF_MAX = 30
+RETRY_STATUS = {429, 500, 502, 503, 504}
+TIMEOUTS = {  # 各接口超时（秒）
+    "token": 10,
+    "list": 60,
+    "sort": 20,
+    "download_link": 30,
+    "save": 60,
+    "task": 15,
+    "delete": 20,
+    "probe": 15,
+    "file": 600,
+}
+
+LINK_BATCH_MAX = int(os.getenv("LINK_BATCH_MAX", "20"))  # 每次 file/download 请求最多携带的 fid 数
+
+# 流水线：列表 → 链接解析 → 转存备用 → 下载 各阶段之间为有界队列，队列满时上游阻塞（背压）
+PIPELINE_QUEUE = int(os.getenv("PIPELINE_QUEUE", "64"))  # 各阶段之间的队列容量
+PIPELINE_LINGER = float(os.getenv("PIPELINE_LINGER", "0.2"))  # 批处理阶段凑批的最长等待（秒）
+
+# 转存副本清理：下载完成后释放的副本攒够 DELETE_BATCH 个或等待 DELETE_LINGER 秒后合并为一次 file/delete
+DELETE_BATCH = int(os.getenv("DELETE_BATCH", "50"))
+DELETE_LINGER = float(os.getenv("DELETE_LINGER", "2"))
+
+# 转存任务轮询：从 TASK_POLL_MIN 开始按 1.5 倍递增到 TASK_POLL_MAX，总时长不超过 TASK_TIMEOUT
+TASK_POLL_MIN = 0.5
+TASK_POLL_MAX = 5.0
+TASK_TIMEOUT = 90
+TRANSFER_TASK_TTL = 86400  # 超时的转存任务最多在之后的运行中追踪多久（秒）
+
+# 内容寻址产物库：按 sha256 保存 APK，工作目录中的目标文件名是指向它的硬链接
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", ".artifacts")
+HASH_BUFFER_MAX = 64 * 1024 * 1024  # 分段乱序到达时用于顺序计算哈希的最大缓冲
+CHECKSUM_FILE = "SHA256SUMS.txt"
+# 发布清单：只有与上次成功发布时摘要不同的资产才放入 RELEASE_DIR 供上传，上传后用 --ack-release 确认
+RELEASE_DIR = os.getenv("RELEASE_DIR", "release")
+RELEASE_MANIFEST = "release_manifest.json"
+QUARANTINE_DIR = os.getenv("QUARANTINE_DIR", os.path.join(ARTIFACT_DIR, "quarantine"))  # 校验失败的下载
+QUARANTINE_KEEP = 10  # 隔离区最多保留的文件数，超出删除最旧的
+
+# 运行指标输出：JSON 报告默认写入 run_report.json，Prometheus 文本格式可选
+METRICS_JSON = os.getenv("METRICS_JSON", "run_report.json")
+METRICS_PROM = os.getenv("METRICS_PROM", "")
+
+# 更新日志库：每个发行版（OK / Pro 等）一个 JSONL 文件（保存在 STATE_DIR），Version-*.txt 由最新 CHANGELOG_KEEP 条渲染生成
+CHANGELOG_KEEP = int(os.getenv("CHANGELOG_KEEP", "10"))  # Version-*.txt 中保留的条目数
+CHANGELOG_MAX = int(os.getenv("CHANGELOG_MAX", "200"))  # 日志库最多保存的版本数，超出后压缩掉最旧的
+
+# 增量模式：目录列表指纹未变化时不再深入处理；无任何变化时以 NOOP_EXIT_CODE 退出
+NOOP_EXIT_CODE = int(os.getenv("NOOP_EXIT_CODE", "3"))
+LIST_FAILED_EXIT_CODE = 1  # 任一目录列表失败：本轮结果不完整，不记录该版本的目录指纹
+
+# 守护模式：各版本按各自间隔轮询（秒），每次间隔随机浮动 ±DAEMON_JITTER
+DAEMON_INTERVAL = int(os.getenv("DAEMON_INTERVAL", "600"))
+DAEMON_INTERVALS = {
+    "ok": int(os.getenv("DAEMON_INTERVAL_OK", str(DAEMON_INTERVAL))),
+    "pro": int(os.getenv("DAEMON_INTERVAL_PRO", str(DAEMON_INTERVAL))),
+}
+DAEMON_JITTER = float(os.getenv("DAEMON_JITTER", "0.1"))
+
+# 分享接口返回 HTTP 401/403、消息含 token 或以下错误码（逗号分隔）时视为 stoken 失效，刷新后重试一次
+STOKEN_ERROR_CODES = {int(c) for c in os.getenv("STOKEN_ERROR_CODES", "").split(",") if c.strip()}
+# stoken 缓存在 STATE_DIR 中；有效期取实际观察到的寿命（失效前存活时长），尚无观察时用 STOKEN_TTL（秒）
+STOKEN_TTL = int(os.getenv("STOKEN_TTL", "7200"))
+STOKEN_MIN_TTL = 60  # 观察到的寿命下限，避免偶发失效导致频繁刷新
+STOKEN_REFRESH_MARGIN = float(os.getenv("STOKEN_REFRESH_MARGIN", "0.2"))  # 剩余寿命不足该比例时提前刷新
+STOKEN_RETRY_AFTER = 60  # 获取失败后间隔多久才再次尝试（秒）
+
+# 持久化状态目录（GitHub Actions 中通过 actions/cache 在多次运行间保留）
+STATE_DIR = os.getenv("MONITOR_STATE_DIR", ".monitor_state")
+LINK_TTL = int(os.getenv("LINK_TTL", "86400"))  # 下载链接缓存有效期（秒）
+LINK_CACHE_MAX = int(os.getenv("LINK_CACHE_MAX", "500"))  # 链接缓存最多条目数，超出按 LRU 淘汰
+
 # 重命名映射（Pro版）
 PRO_RENAME_MAP = {
     r"OK影视Pro-电视版-32位-.*\.apk": "leanback-armeabi_v7a-pro.apk",
@@ -31,19 +152,297 @@ OK_RENAME_MAP = {
     r"OK影视-手机版-.*\.apk": "mobile-arm64_v8a-ok.apk",
 }
 
+# 声明式监控配置（JSON，格式见 monitor_config.example.json）；文件不存在时使用下面由上述常量组成的默认配置
+MONITOR_CONFIG = os.getenv("MONITOR_CONFIG", "monitor_config.json")
+DEFAULT_CONFIG = {
+    "shares": [{
+        "pwd_id": PWD_ID,
+        "editions": [
+            {"id": "ok", "label": "OK", "dir": TARGET_DIRS[1], "select": "latest_subfolder",
+             "rename": OK_RENAME_MAP, "only_renamed": True},
+            {"id": "pro", "label": "Pro", "dir": TARGET_DIRS[0], "select": "flat", "rename": PRO_RENAME_MAP},
+        ],
+    }],
+}
+
+# ===== 延迟初始化 =====
+# 首次访问属性时才创建对象，导入本模块不会产生任何网络或磁盘操作
+class LazyObject:
+    def __init__(self, factory):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_obj", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _get(self):
+        if self._obj is None:
+            with self._lock:
+                if self._obj is None:
+                    object.__setattr__(self, "_obj", self._factory())
+        return self._obj
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+# ===== 运行指标 =====
+# 各阶段耗时（span）与计数器（字节数、重试、缓存命中、接口错误码等），导出为 JSON 报告或 Prometheus 文本
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.spans = {}
+        self.counters = {}
+        self.gauges = {}
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                st = self.spans.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+                st["count"] += 1
+                st["total"] += elapsed
+                st["max"] = max(st["max"], elapsed)
+
+    def incr(self, name, value=1, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def report(self):
+        with self.lock:
+            return {
+                "started_at": datetime.fromtimestamp(self.started).strftime("%Y-%m-%d %H:%M:%S"),
+                "elapsed_s": round(time.time() - self.started, 3),
+                "spans": {
+                    name: {"count": st["count"], "total_s": round(st["total"], 3), "max_s": round(st["max"], 3)}
+                    for name, st in sorted(self.spans.items())
+                },
+                "counters": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self.counters.items())],
+                "gauges": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self.gauges.items())],
+            }
+
+    def prometheus(self, prefix="kuake"):
+        def fmt(labels):
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+
+        lines = []
+        with self.lock:
+            for name, st in sorted(self.spans.items()):
+                lbl = fmt((("stage", name),))
+                lines.append(f"{prefix}_stage_seconds_sum{lbl} {st['total']:.6f}")
+                lines.append(f"{prefix}_stage_seconds_count{lbl} {st['count']}")
+                lines.append(f"{prefix}_stage_seconds_max{lbl} {st['max']:.6f}")
+            for (name, labels), v in sorted(self.counters.items()):
+                lines.append(f"{prefix}_{name}_total{fmt(labels)} {v}")
+            for (name, labels), v in sorted(self.gauges.items()):
+                lines.append(f"{prefix}_{name}{fmt(labels)} {v}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, json_path=METRICS_JSON, prom_path=METRICS_PROM):
+        if json_path:
+            atomic_write_json(json_path, self.report())
+        if prom_path:
+            with open(prom_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus())
+
+
+METRICS = Metrics()
+
+def timed(name):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with METRICS.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# ===== 文件名分类 =====
+# 把所有重命名规则编译成一个带命名分组的正则，一次匹配得到版本、架构和目标文件名
+Classification = namedtuple("Classification", ["edition", "target", "form", "arch"])
+TARGET_NAME_RE = re.compile(r"^(?P<form>.+?)-(?P<arch>armeabi_v7a|arm64_v8a|universal)-(?P<edition>[^-]+)\.apk$")
+
+class FilenameClassifier:
+    # rule_maps: [(edition, {pattern: target_name}), ...]，按顺序优先匹配，与逐条 re.search 结果一致
+    def __init__(self, rule_maps):
+        self.rules = []
+        parts = []
+        for edition, mapping in rule_maps:
+            for pattern, target in mapping.items():
+                m = TARGET_NAME_RE.match(target)
+                form, arch = (m.group("form"), m.group("arch")) if m else (target[:-4], "")
+                parts.append(f"(?P<r{len(self.rules)}>.*?(?:{pattern}))")
+                self.rules.append(Classification(edition, target, form, arch))
+        self.regex = re.compile("|".join(parts)) if parts else None
+
+    def classify(self, name):
+        m = self.regex.match(name) if self.regex else None
+        return self.rules[int(m.lastgroup[1:])] if m else None
+
+    def edition_of(self, name):
+        c = self.classify(name)
+        return c.edition if c else None
+
+    def target_name(self, name):
+        c = self.classify(name)
+        if c:
+            return c.target
+        return name.replace(".apk", "").replace(" ", "_").replace("/", "_") + ".apk"
+
+
+CLASSIFIER = LazyObject(lambda: FilenameClassifier(CONFIG.rule_maps()))
+
+# ===== 监控配置 =====
+# 一个分享中的一个监控目录；select 为选取策略（见 SELECTORS），only_renamed 时只保留命中本版本重命名规则的 APK
+Edition = namedtuple("Edition", ["id", "label", "pwd_id", "dir", "select", "rename", "only_renamed", "interval"])
+
+class MonitorConfig:
+    def __init__(self, data):
+        self.concurrency = {"downloads": DOWNLOAD_WORKERS, "listing": LIST_WORKERS, "scans": 4}
+        self.concurrency.update(data.get("concurrency", {}))
+        self.passcodes = {}
+        self.editions = OrderedDict()
+        for share in data.get("shares", []):
+            pwd_id = share["pwd_id"]
+            self.passcodes[pwd_id] = share.get("passcode", "")
+            for e in share.get("editions", []):
+                if e["id"] in self.editions:
+                    raise ValueError(f"版本 id 重复: {e['id']}")
+                if e.get("select", "flat") not in SELECTORS:
+                    raise ValueError(f"未知选取策略 {e.get('select')} ({e['id']})")
+                self.editions[e["id"]] = Edition(
+                    id=e["id"],
+                    label=e.get("label", e["id"]),
+                    pwd_id=pwd_id,
+                    dir=e["dir"],
+                    select=e.get("select", "flat"),
+                    rename=e.get("rename", {}),
+                    only_renamed=e.get("only_renamed", False),
+                    interval=e.get("interval") or DAEMON_INTERVALS.get(e["id"], DAEMON_INTERVAL),
+                )
+        if not self.editions:
+            raise ValueError("配置中没有任何监控目录")
+
+    @classmethod
+    def load(cls, path):
+        if path and os.path.exists(path):
+            print(f"使用监控配置: {path}")
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(json.load(f))
+        return cls(DEFAULT_CONFIG)
+
+    def rule_maps(self):
+        return [(e.id, e.rename) for e in self.editions.values()]
+
+    def share_of(self, f):
+        edition = self.editions.get(f.get("_edition"))
+        return edition.pwd_id if edition else PWD_ID
+
+
+CONFIG = LazyObject(lambda: MonitorConfig.load(MONITOR_CONFIG))
+
+# ===== HTTP 客户端 =====
+# 所有请求共用一个连接池（keep-alive），失败按指数退避 + 抖动重试，遵循 Retry-After
+class QuarkClient:
+    def __init__(self, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, pool_size=None):
+        import requests
+
+        self.retries = retries
+        self.backoff = backoff
+        pool_size = pool_size or max(10, CONFIG.concurrency["listing"], CONFIG.concurrency["downloads"] * SEGMENT_WORKERS)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _backoff(self, attempt):
+        delay = min(HTTP_BACKOFF_MAX, self.backoff * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    @staticmethod
+    def _retry_after(r):
+        value = r.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return min(HTTP_BACKOFF_MAX, max(0.0, float(value)))
+        except ValueError:
+            pass
+        try:
+            return min(HTTP_BACKOFF_MAX, max(0.0, parsedate_to_datetime(value).timestamp() - time.time()))
+        except (TypeError, ValueError):
+            return None
+
+    # idempotent=False 的接口（转存、删除）只在请求确定未被处理时重试：连接超时或 429
+    def request(self, method, url, endpoint, retries=None, idempotent=True, **kwargs):
+        import requests
+
+        retries = self.retries if retries is None else retries
+        kwargs.setdefault("timeout", TIMEOUTS.get(endpoint, 30))
+        attempt = 0
+        while True:
+            try:
+                r = self.session.request(method, url, **kwargs)
+                self._record(endpoint, r, kwargs.get("stream"))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                METRICS.incr("http_errors", endpoint=endpoint, error=type(e).__name__)
+                retryable = idempotent or isinstance(e, requests.ConnectTimeout)
+                if not retryable or attempt >= retries:
+                    raise
+                delay = self._backoff(attempt)
+                reason = type(e).__name__
+            else:
+                retryable = r.status_code in RETRY_STATUS if idempotent else r.status_code == 429
+                if not retryable or attempt >= retries:
+                    return r
+                delay = self._retry_after(r)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                reason = f"HTTP {r.status_code}"
+                r.close()
+            METRICS.incr("http_retries", endpoint=endpoint)
+            print(f" {endpoint} 请求失败 ({reason})，{delay:.1f}s 后第 {attempt + 1} 次重试")
+            time.sleep(delay)
+            attempt += 1
+
+    # 统计请求数与接口错误码（JSON 响应中 code 非 0）
+    @staticmethod
+    def _record(endpoint, r, stream=False):
+        METRICS.incr("http_requests", endpoint=endpoint, status=r.status_code)
+        if stream or "json" not in r.headers.get("Content-Type", ""):
+            return
+        try:
+            code = r.json().get("code")
+        except (ValueError, AttributeError):
+            return
+        if code not in (0, None):
+            METRICS.incr("api_errors", endpoint=endpoint, code=code)
+
+    def get(self, url, endpoint, **kwargs):
+        return self.request("GET", url, endpoint, **kwargs)
+
+    def post(self, url, endpoint, **kwargs):
+        return self.request("POST", url, endpoint, **kwargs)
+
+
+CLIENT = LazyObject(QuarkClient)
+
 # ===== stoken 获取 =====
 def get_share_token(pwd_id=PWD_ID, passcode=""):
     print("正在通过官方接口获取/刷新 stoken...")
-    url = "https://drive-pc.quark.cn/1/clouddrive/share/sharepage/token?pr=ucpro&fr=pc"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) quark-cloud-drive/2.5.20 Chrome/100.0.4896.160 Electron/18.3.5.4-b478491100 Safari/537.36 Channel/pckk_other_ch",
-        "Referer": "https://drive.quark.cn/",
-        "Content-Type": "application/json",
-        "Cookie": COOKIE,
-    }
+    url = f"{DRIVE_PC_API}/1/clouddrive/share/sharepage/token?pr=ucpro&fr=pc"
+    headers = get_headers()
     payload = {"pwd_id": pwd_id, "passcode": passcode}
     try:
-        r = requests.post(url, json=payload, headers=headers, timeout=10)
+        r = CLIENT.post(url, "token", json=payload, headers=headers)
         print(f"官方 token 接口状态码: {r.status_code}")
         print(f"响应: {r.text[:300]}...")  # 调试用
         if r.status_code == 200:
@@ -60,54 +459,146 @@ def get_share_token(pwd_id=PWD_ID, passcode=""):
         print("官方 token 接口异常:", str(e))
     return None
 
-def get_latest_stoken():
-    stoken = get_share_token()
+def get_latest_stoken(pwd_id=PWD_ID):
+    stoken = get_share_token(pwd_id, CONFIG.passcodes.get(pwd_id, ""))
     if stoken:
         return stoken
-    stoken = os.getenv("QUARK_STOKEN")
+    stoken = os.getenv("QUARK_STOKEN") if pwd_id == PWD_ID else None
     if stoken:
         print("使用 GitHub Secrets 的 stoken:", stoken[:10] + "...")
         return stoken
     print("❌ 所有方式都无法获取有效 stoken")
     return None
 
-# 调试信息
-print("=== 调试信息 ===")
-COOKIE = os.getenv("QUARK_COOKIE")
-STOKEN = get_latest_stoken()
-print(f"QUARK_COOKIE 是否存在: {'是' if COOKIE else '否'}")
-if COOKIE:
-    print(f"QUARK_COOKIE 长度: {len(COOKIE)}")
-    print(f"QUARK_COOKIE 前20字符: {COOKIE[:20]}...")
-print(f"最终使用的 stoken: {STOKEN[:10] + '...' if STOKEN else '无'}")
-print("=== 调试结束 ===\n")
-
-if not STOKEN:
-    print("❌ 缺少有效 stoken，无法继续")
-    exit(1)
-if not COOKIE:
-    print("⚠️ 缺少 QUARK_COOKIE → 只能扫描列表，无法转存和获取下载链接")
-
-FILES_CACHE = {}
-FILES_LOCK = threading.Lock()
+# stoken 生命周期：按分享缓存到磁盘，临近过期时提前刷新，失效时记录实际寿命；
+# 每个分享一把锁，并发失败的调用只会触发一次刷新
+class TokenManager:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.share_locks = {}
+        self.tokens = load_json(path, {})  # pwd_id → {"stoken", "fetched_at", "lifetimes"}
 
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) quark-cloud-drive/2.5.20 Chrome/100.0.4896.160 Electron/18.3.5.4-b478491100 Safari/537.36 Channel/pckk_other_ch",
-    "Referer": "https://drive.quark.cn/",
-    "Content-Type": "application/json",
-    "Cookie": COOKIE,
-}
+    def _share_lock(self, pwd_id):
+        with self.lock:
+            return self.share_locks.setdefault(pwd_id, threading.Lock())
+
+    # 最近几次观察到的寿命取中位数；还没有观察时用 STOKEN_TTL
+    @staticmethod
+    def lifetime(entry):
+        lifetimes = sorted(entry.get("lifetimes") or [])
+        if not lifetimes:
+            return STOKEN_TTL
+        return max(STOKEN_MIN_TTL, lifetimes[len(lifetimes) // 2])
+
+    def _fresh(self, entry):
+        if not entry or not entry.get("stoken"):
+            return False
+        age = time.time() - entry.get("fetched_at", 0)
+        return age < self.lifetime(entry) * (1 - STOKEN_REFRESH_MARGIN)
+
+    def get(self, pwd_id):
+        entry = self.tokens.get(pwd_id)
+        if self._fresh(entry):
+            return entry["stoken"]
+        if entry and not entry.get("stoken") and time.time() - entry.get("fetched_at", 0) < STOKEN_RETRY_AFTER:
+            return None
+        return self.refresh(pwd_id, stale=entry.get("stoken") if entry else None, failed=False)
+
+    # 刷新 stoken；stale 不再是当前值且当前值仍有效时说明其他线程已刷新，直接返回新值。
+    # failed 表示 stale 是因为接口报失效而被淘汰的，此时记录它的实际寿命
+    def refresh(self, pwd_id, stale=None, failed=True):
+        with self._share_lock(pwd_id):
+            entry = self.tokens.get(pwd_id) or {}
+            current = entry.get("stoken")
+            if current and current != stale and self._fresh(entry):
+                return current
+            lifetimes = list(entry.get("lifetimes") or [])
+            if failed and current and current == stale and entry.get("fetched_at"):
+                lifetime = int(time.time() - entry["fetched_at"])
+                lifetimes = (lifetimes + [lifetime])[-5:]
+                print(f"stoken 失效（存活 {lifetime}s），重新获取...")
+            elif current:
+                print(f"stoken 即将过期（有效期约 {self.lifetime(entry)}s），提前刷新...")
+            METRICS.incr("stoken_refreshes", reason="failed" if failed else ("expiring" if current else "initial"))
+            stoken = get_latest_stoken(pwd_id) or ""
+            with self.lock:
+                self.tokens[pwd_id] = {"stoken": stoken, "fetched_at": time.time(), "lifetimes": lifetimes}
+                self.save()
+            return stoken or None
+
+    def save(self):
+        atomic_write_json(self.path, self.tokens)
 
-# ===== 打印当前目录（排查用） =====
-print("\n当前工作目录:", os.getcwd())
-print("当前目录初始文件列表:", os.listdir('.'))
+TOKENS = LazyObject(lambda: TokenManager(os.path.join(STATE_DIR, "stoken.json")))
+
+def get_stoken(pwd_id=PWD_ID):
+    return TOKENS.get(pwd_id)
+
+def refresh_stoken(stale=None, pwd_id=PWD_ID):
+    return TOKENS.refresh(pwd_id, stale)
+
+def is_stoken_error(status_code, data):
+    if status_code in (401, 403):
+        return True
+    if not isinstance(data, dict):
+        return False
+    if data.get("code") in STOKEN_ERROR_CODES:
+        return True
+    return data.get("code") not in (0, None) and "token" in str(data.get("message") or data.get("msg") or "").lower()
+
+# 调用需要 stoken 的分享接口：send(stoken) 返回响应；遇到 stoken 失效时刷新并重试一次，返回 (响应, JSON 或 None)
+def call_with_stoken(pwd_id, send):
+    stoken = get_stoken(pwd_id)
+    r = send(stoken)
+    data = _json_or_none(r)
+    if is_stoken_error(r.status_code, data):
+        fresh = refresh_stoken(stoken, pwd_id)
+        if fresh:
+            METRICS.incr("stoken_retries")
+            r = send(fresh)
+            data = _json_or_none(r)
+    return r, data
+
+def _json_or_none(r):
+    try:
+        return r.json()
+    except ValueError:
+        return None
+
+def get_cookie():
+    return os.getenv("QUARK_COOKIE")
+
+def get_headers():
+    return {
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) quark-cloud-drive/2.5.20 Chrome/100.0.4896.160 Electron/18.3.5.4-b478491100 Safari/537.36 Channel/pckk_other_ch",
+        "Referer": "https://drive.quark.cn/",
+        "Content-Type": "application/json",
+        "Cookie": get_cookie(),
+    }
+
+# 调试信息
+def print_debug_info():
+    cookie = get_cookie()
+    print("=== 调试信息 ===")
+    print(f"QUARK_COOKIE 是否存在: {'是' if cookie else '否'}")
+    if cookie:
+        print(f"QUARK_COOKIE 长度: {len(cookie)}")
+        print(f"QUARK_COOKIE 前20字符: {cookie[:20]}...")
+    print("=== 调试结束 ===\n")
+    if not cookie:
+        print("⚠️ 缺少 QUARK_COOKIE → 只能扫描列表，无法转存和获取下载链接")
+
+    # 打印当前目录（排查用）
+    print("\n当前工作目录:", os.getcwd())
+    print("当前目录初始文件列表:", os.listdir('.'))
 
 # ===== 测试个人网盘访问 =====
 def test_personal_drive():
-    test_url = "https://drive-pc.quark.cn/1/clouddrive/file/sort?pr=ucpro&fr=pc&pdir_fid=0&_fetch_total=1&_size=10"
+    test_url = f"{DRIVE_PC_API}/1/clouddrive/file/sort?pr=ucpro&fr=pc&pdir_fid=0&_fetch_total=1&_size=10"
     print("\n=== 测试个人网盘访问 ===")
     try:
-        r = requests.get(test_url, headers=HEADERS, timeout=20)
+        r = CLIENT.get(test_url, "sort", headers=get_headers())
         print(f"状态码: {r.status_code}")
         if r.status_code == 200:
             print("Cookie 有效，能访问个人网盘")
@@ -118,477 +609,1821 @@ def test_personal_drive():
     print("=== 测试结束 ===\n")
 
 # ===== 列表相关函数 =====
-def fetch_page(pdir_fid, page=1):
+LIST_POOL = LazyObject(lambda: ThreadPoolExecutor(max_workers=max(1, CONFIG.concurrency["listing"]), thread_name_prefix="list"))
+
+# 列表请求重试后仍失败；任何一页失败都视为整个目录列表失败，不能当作空目录或未变化
+class ListingError(Exception):
+    pass
+
+def _list_total(data):
+    body = data.get("data") or {}
+    for meta in (data.get("metadata"), body.get("metadata"), (body.get("detail_info") or {}).get("metadata")):
+        if isinstance(meta, dict) and meta.get("_total") is not None:
+            return int(meta["_total"])
+    return None
+
+@timed("fetch_page")
+def fetch_page_meta(pdir_fid, page=1, pwd_id=PWD_ID):
     print(f"请求列表: pdir_fid={pdir_fid[:8]}, page={page}")
     try:
-        r = requests.post(
+        r, data = call_with_stoken(pwd_id, lambda stoken: CLIENT.post(
             WORKER_URL,
+            "list",
             json={
-                "pwd_id": PWD_ID,
-                "stoken": STOKEN,
+                "pwd_id": pwd_id,
+                "stoken": stoken,
                 "pdir_fid": pdir_fid,
                 "_page": page,
                 "_size": PAGE_SIZE,
+                "_fetch_total": 1,
                 "ver": 2,
                 "pr": "ucpro",
                 "fr": "h5",
             },
-            timeout=60,
-        )
+        ))
         r.raise_for_status()
-        data = r.json()
         list_data = data.get("data", {}).get("detail_info", {}).get("list", [])
         print(f" 返回 {len(list_data)} 条数据")
-        return list_data
+        return list_data, _list_total(data)
     except Exception as e:
-        print(f"列表请求失败 {pdir_fid[:8]}: {str(e)}")
-        return []
+        print(f"列表请求失败 {pdir_fid[:8]} 第 {page} 页: {str(e)}")
+        raise ListingError(f"{pdir_fid[:8]} 第 {page} 页: {str(e)}") from e
 
-def get_apks_in_dir(fid, is_pro=False):
-    files = []
-    page = 1
+def fetch_page(pdir_fid, page=1, pwd_id=PWD_ID):
+    return fetch_page_meta(pdir_fid, page, pwd_id)[0]
+
+# 先取第 1 页拿到总数，其余页并发请求；拿不到总数时按批次投机预取后续页
+# on_page: 每页到达时回调（按页序），供流水线在列表完成前就开始处理
+@timed("list_dir")
+def list_dir(fid, pwd_id=PWD_ID, on_page=None):
+    on_page = on_page or (lambda items: None)
+    first, total = fetch_page_meta(fid, 1, pwd_id)
+    files = list(first)
+    on_page(first)
+    if len(first) < PAGE_SIZE:
+        return files
+    fetch = lambda p: fetch_page(fid, p, pwd_id)
+    if total is not None:
+        last_page = (total + PAGE_SIZE - 1) // PAGE_SIZE
+        for page_data in LIST_POOL.map(fetch, range(2, last_page + 1)):
+            files.extend(page_data)
+            on_page(page_data)
+        return files
+    page = 2
     while True:
-        page_data = fetch_page(fid, page)
-        if not page_data:
-            break
-        files.extend(page_data)
-        if len(page_data) < PAGE_SIZE:
-            break
-        page += 1
-    if is_pro:
-        apks = [f for f in files if not f.get("dir") and f.get("file_type") == 1 and f.get("file_name", "").endswith(".apk")]
-    else:
-        target_keywords = ["OK影视-电视版", "OK影视-手机版", "海信专版-OK影视"]
-        apks = [
-            f for f in files
-            if not f.get("dir")
-            and f.get("file_type") == 1
-            and f.get("file_name", "").endswith(".apk")
-            and any(kw in f.get("file_name", "") for kw in target_keywords)
-        ]
+        for page_data in LIST_POOL.map(fetch, range(page, page + max(1, LIST_PREFETCH))):
+            files.extend(page_data)
+            on_page(page_data)
+            if len(page_data) < PAGE_SIZE:
+                return files
+        page += max(1, LIST_PREFETCH)
+
+def filter_targets(files, edition):
+    apks = [
+        f for f in files
+        if not f.get("dir")
+        and f.get("file_type") == 1
+        and f.get("file_name", "").endswith(".apk")
+        and (not edition.only_renamed or CLASSIFIER.edition_of(f.get("file_name", "")) == edition.id)
+    ]
     txts = [f for f in files if not f.get("dir") and f.get("file_name", "").lower().endswith(".txt")]
-    print(f" 目录 {fid[:8]} 找到 {len(apks)} 个目标 APK, {len(txts)} 个 TXT")
     return apks, txts
 
-def get_latest_subfolder(fid):
-    files = fetch_page(fid)
+# 目录列表指纹：fid + 大小 + 更新时间 (+ 子项数)，任一文件增删改都会改变指纹
+def listing_fingerprint(files):
+    items = sorted(
+        (f.get("fid", ""), f.get("size", 0), f.get("updated_at") or f.get("last_update_at") or 0, f.get("include_items", 0))
+        for f in files
+    )
+    return hashlib.sha1(json.dumps(items).encode("utf-8")).hexdigest()[:16]
+
+# 按版本号排序：名称中的数字段逐段比较（3.10.0 > 3.9.1），相同时比较更新时间
+def folder_version_key(f):
+    numbers = tuple(int(n) for n in re.findall(r"\d+", f.get("file_name", "")))
+    return numbers, f.get("updated_at") or f.get("last_update_at") or 0
+
+def get_latest_subfolder(fid, files=None, pwd_id=PWD_ID):
+    if files is None:
+        files = list_dir(fid, pwd_id)
     folders = [f for f in files if f.get("dir")]
     if not folders:
         print(f" 目录 {fid[:8]} 无子文件夹")
         return None
-    def key(f):
-        name = f.get("file_name", "")
-        digits = "".join(c for c in name if c.isdigit())
-        return int(digits) if digits else -1
-    latest = max(folders, key=key)
+    latest = max(folders, key=folder_version_key)
     print(f" 找到最新子文件夹: {latest.get('file_name', '?')}")
     return latest
 
+# 列出一个目录并与上次指纹对比；未变化时返回 None（增量模式下不再处理）。列表失败时抛出 ListingError
+def scan_dir(fid, incremental=True, pwd_id=PWD_ID, on_page=None):
+    files = list_dir(fid, pwd_id, on_page)
+    fp = listing_fingerprint(files)
+    if incremental and STATE.dir_fingerprint(fid) == fp:
+        print(f" 目录 {fid[:8]} 指纹未变化，跳过")
+        return None, fp
+    return files, fp
+
+# 选取策略：返回 (候选文件列表，目录未变化时为 None, {目录 fid: 指纹})
+def select_flat(edition, incremental=True, on_page=None):
+    files, fp = scan_dir(edition.dir, incremental, edition.pwd_id, on_page)
+    return files, ({edition.dir: fp} if files is not None else {})
+
+def select_latest_subfolder(edition, incremental=True, on_page=None):
+    top, top_fp = scan_dir(edition.dir, incremental, edition.pwd_id)
+    if top is None:
+        return None, {}
+    fps = {edition.dir: top_fp}
+    latest = get_latest_subfolder(edition.dir, top, edition.pwd_id)
+    if not latest:
+        return None, fps
+    print(f"最新子文件夹：{latest.get('file_name', '?')}")
+    files, fp = scan_dir(latest["fid"], incremental, edition.pwd_id, on_page)
+    fps[latest["fid"]] = fp
+    return files, fps
+
+SELECTORS = {
+    "flat": select_flat,
+    "latest_subfolder": select_latest_subfolder,
+}
+
+# 返回 (apks, txts, {目录 fid: 指纹})；文件上标记所属版本，供后续按分享解析链接。
+# 传入 sink 时每页中的目标文件一到达就交给 sink（目录指纹未变化时这些文件也都已记录在状态中，会被跳过）
+def scan_edition(edition, incremental=True, sink=None):
+    def on_page(items):
+        apks, txts = filter_targets(items, edition)
+        for f in apks + txts:
+            f["_edition"] = edition.id
+            sink(f)
+
+    files, fps = SELECTORS[edition.select](edition, incremental, on_page if sink else None)
+    if files is None:
+        return [], [], fps
+    apks, txts = filter_targets(files, edition)
+    for f in apks + txts:
+        f["_edition"] = edition.id
+    print(f" [{edition.label}] 找到 {len(apks)} 个目标 APK, {len(txts)} 个 TXT")
+    return apks, txts, fps
+
 # ===== 转存文件 =====
-def copy_file(fid, share_fid_token=""):
-    if not COOKIE:
-        print(f" 无 COOKIE，跳过转存 {fid[:8]}")
-        return None
-    url = "https://drive.quark.cn/1/clouddrive/share/sharepage/save?pr=ucpro&fr=pc"
+# 一次 save 请求提交多个 fid，轮询同一个任务，返回 {源 fid: local_fid}
+@timed("copy_file")
+def copy_files(items, pwd_id=PWD_ID):
+    if not get_cookie():
+        print(f" 无 COOKIE，跳过转存 {len(items)} 个文件")
+        return {}
+    if not items:
+        return {}
+    fids = [fid for fid, _ in items]
+    url = f"{DRIVE_API}/1/clouddrive/share/sharepage/save?pr=ucpro&fr=pc"
     payload = {
-        "fid_list": [fid],
-        "fid_token_list": [share_fid_token],
+        "fid_list": fids,
+        "fid_token_list": [token for _, token in items],
         "to_pdir_fid": "0",
-        "pwd_id": PWD_ID,
-        "stoken": STOKEN,
+        "pwd_id": pwd_id,
         "pdir_fid": "0",
         "scene": "link",
     }
-    print(f"开始转存 {fid[:8]}...")
+    label = fids[0][:8] if len(fids) == 1 else f"{len(fids)} 个文件"
+    print(f"开始转存 {label}...")
     try:
-        r = requests.post(url, json=payload, headers=HEADERS, timeout=60)
+        r, data = call_with_stoken(pwd_id, lambda stoken: CLIENT.post(
+            url, "save", idempotent=False, json=dict(payload, stoken=stoken), headers=get_headers()))
         r.raise_for_status()
-        data = r.json()
         task_id = data.get("data", {}).get("task_id")
         if not task_id:
-            print(f" 转存失败 {fid[:8]}: 无 task_id")
-            return None
-        for i in range(60):
-            time.sleep(1.2)
-            status_url = f"https://drive-pc.quark.cn/1/clouddrive/task?pr=ucpro&fr=pc&retry_index={i}&task_id={task_id}"
-            rs = requests.get(status_url, headers=HEADERS, timeout=15)
-            js = rs.json()
+            print(f" 转存失败 {label}: 无 task_id")
+            return {}
+        deadline = time.monotonic() + TASK_TIMEOUT
+        delay = TASK_POLL_MIN
+        i = 0
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = min(TASK_POLL_MAX, delay * 1.5)
+            js = query_task(task_id, i)
+            i += 1
             code = js.get("code")
             if code in [31001, 32003]:
-                print(f" 转存失败 {fid[:8]} code={code}")
-                return None
-            fids = js.get("data", {}).get("save_as", {}).get("save_as_top_fids", [])
-            for lf in fids:
-                if lf:
-                    print(f" 转存成功 {fid[:8]} → local_fid={lf[:8]}")
-                    return lf
-        print(f" 转存超时 {fid[:8]}")
-        return None
+                print(f" 转存失败 {label} code={code}")
+                return {}
+            top_fids = js.get("data", {}).get("save_as", {}).get("save_as_top_fids", [])
+            if not any(top_fids):
+                continue
+            if len(top_fids) != len(fids):
+                print(f" 转存结果数量不符 {label}: {len(top_fids)}/{len(fids)}，无法对应源文件，副本登记后统一删除")
+                TRANSFERS.add_unmapped([lf for lf in top_fids if lf])
+                return {}
+            mapping = {fid: lf for fid, lf in zip(fids, top_fids) if lf}
+            TRANSFERS.add(mapping)
+            for fid, lf in mapping.items():
+                print(f" 转存成功 {fid[:8]} → local_fid={lf[:8]}")
+            return mapping
+        print(f" 转存超时 {label}，任务 {task_id} 留待下次运行查询并回收副本")
+        TRANSFERS.add_task(task_id)
+        return {}
     except Exception as e:
-        print(f" 转存异常 {fid[:8]}: {str(e)}")
-        return None
+        print(f" 转存异常 {label}: {str(e)}")
+        return {}
+
+def query_task(task_id, retry_index=0):
+    status_url = f"{DRIVE_PC_API}/1/clouddrive/task?pr=ucpro&fr=pc&retry_index={retry_index}&task_id={task_id}"
+    return CLIENT.get(status_url, "task", headers=get_headers()).json()
+
+def copy_file(fid, share_fid_token="", pwd_id=PWD_ID):
+    return copy_files([(fid, share_fid_token)], pwd_id).get(fid)
+
+# ===== 持久化状态 =====
+# 先写临时文件再 os.replace，读者不会看到写了一半的文件；目录不存在时自动创建
+def atomic_write_text(path, text):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp{threading.get_ident()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def atomic_write_json(path, obj):
+    atomic_write_text(path, json.dumps(obj, ensure_ascii=False))
+
+
+def load_json(path, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+# 记录已处理过的分享文件：fid → (size, updated_at)，签名不变的文件下次直接跳过
+class StateStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        data = load_json(path, {})
+        self.files = data.get("files", {})
+        self.dirs = data.get("dirs", {})
+
+    @staticmethod
+    def signature(f):
+        return [f.get("size", 0), f.get("updated_at") or f.get("last_update_at") or 0]
+
+    def is_unchanged(self, f):
+        with self.lock:
+            entry = self.files.get(f.get("fid", ""))
+        return bool(entry) and entry.get("sig") == self.signature(f)
+
+    def mark_done(self, f, **extra):
+        entry = {"sig": self.signature(f), "name": f.get("file_name", ""), "done_at": int(time.time())}
+        entry.update(extra)
+        with self.lock:
+            self.files[f.get("fid", "")] = entry
+            self.save()
+
+    def dir_fingerprint(self, fid):
+        with self.lock:
+            return self.dirs.get(fid)
+
+    def set_dir_fingerprints(self, fingerprints):
+        with self.lock:
+            self.dirs.update(fingerprints)
+            self.save()
+
+    # 让这些文件下次重新下载：移除其记录并清空目录指纹（否则增量扫描不会再列出它们），返回实际移除的数量
+    def forget(self, fids):
+        with self.lock:
+            removed = [fid for fid in fids if self.files.pop(fid, None) is not None]
+            if removed:
+                self.dirs.clear()
+                self.save()
+        return len(removed)
+
+    def save(self):
+        atomic_write_json(self.path, {"files": self.files, "dirs": self.dirs})
+
+
+STATE = LazyObject(lambda: StateStore(os.path.join(STATE_DIR, "files.json")))
+
+# 下载链接缓存：fid → {ori_urls, cookies, local_fid, expires}，按 TTL 过期、按 LRU 淘汰，跨运行持久化
+class LinkCache:
+    def __init__(self, path, ttl=LINK_TTL, max_entries=LINK_CACHE_MAX, lock=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.lock = lock or threading.Lock()
+        self.entries = OrderedDict(load_json(path, {}).get("entries", {}))
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        with self.lock:
+            now = time.time()
+            for fid in [k for k, v in self.entries.items() if v.get("expires", 0) <= now]:
+                self._evict(fid)
+
+    def _evict(self, fid):
+        self.entries.pop(fid, None)
+        self.stats["evictions"] += 1
+
+    def get(self, fid):
+        with self.lock:
+            entry = self.entries.get(fid)
+            if entry and entry.get("expires", 0) <= time.time():
+                self._evict(fid)
+                entry = None
+            if not entry or not entry.get("ori_urls"):
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(fid)
+            self.stats["hits"] += 1
+            return dict(entry)
+
+    def put(self, fid, ori_urls, cookies="", local_fid=None):
+        entry = {"ori_urls": ori_urls, "cookies": cookies, "expires": time.time() + self.ttl}
+        if local_fid:
+            entry["local_fid"] = local_fid
+        with self.lock:
+            self.entries[fid] = entry
+            self.entries.move_to_end(fid)
+            while len(self.entries) > self.max_entries:
+                self._evict(next(iter(self.entries)))
+            self.save()
+
+    # 链接下载到的内容校验失败时丢弃，下次重新获取
+    def discard(self, fid):
+        with self.lock:
+            if self.entries.pop(fid, None) is not None:
+                self.save()
+
+    # 转存副本删除后，指向它的链接随之失效
+    def discard_local(self, local_fids):
+        local_fids = set(local_fids)
+        with self.lock:
+            stale = [k for k, v in self.entries.items() if v.get("local_fid") in local_fids]
+            for fid in stale:
+                self.entries.pop(fid)
+            if stale:
+                self.save()
+
+    def items(self):
+        with self.lock:
+            return [(k, dict(v)) for k, v in self.entries.items()]
+
+    def save(self):
+        atomic_write_json(self.path, {"entries": self.entries})
+
+    def summary(self):
+        return f"命中 {self.stats['hits']} / 未命中 {self.stats['misses']} / 淘汰 {self.stats['evictions']}"
+
+
+FILES_LOCK = threading.Lock()
+FILES_CACHE = LazyObject(lambda: LinkCache(os.path.join(STATE_DIR, "links.json"), lock=FILES_LOCK))
+
+# 转存副本台账：local_fid → {fid, at}，转存成功即记录、删除成功才移除；启动时已存在的条目是上次运行遗留的副本
+class TransferLedger:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        data = load_json(path, {})
+        self.entries = data.get("entries", {})
+        self.tasks = data.get("tasks", {})  # 轮询超时的转存任务：task_id → 提交时间，下次运行再查询其副本
+        self.leftovers = set(self.entries)
+
+    def add(self, mapping):
+        if not mapping:
+            return
+        with self.lock:
+            for fid, local_fid in mapping.items():
+                self.entries[local_fid] = {"fid": fid, "at": int(time.time())}
+            self.save()
+
+    # 无法对应到源文件的副本（结果数量不符、超时任务事后完成）也要登记，由清理统一删除
+    def add_unmapped(self, local_fids):
+        if not local_fids:
+            return
+        with self.lock:
+            for lf in local_fids:
+                self.entries[lf] = {"fid": "", "at": int(time.time())}
+            self.save()
+
+    def add_task(self, task_id):
+        with self.lock:
+            self.tasks[task_id] = int(time.time())
+            self.save()
+
+    def pending_tasks(self):
+        with self.lock:
+            return dict(self.tasks)
+
+    def remove_task(self, task_id):
+        with self.lock:
+            self.tasks.pop(task_id, None)
+            self.save()
+
+    def local_fids(self, fid=None):
+        with self.lock:
+            return [lf for lf, e in self.entries.items() if fid is None or e.get("fid") == fid]
+
+    def take_leftovers(self):
+        with self.lock:
+            leftovers = [lf for lf in self.leftovers if lf in self.entries]
+            self.leftovers.clear()
+            return leftovers
+
+    def remove(self, local_fids):
+        with self.lock:
+            for lf in local_fids:
+                self.entries.pop(lf, None)
+            self.save()
+
+    def save(self):
+        atomic_write_json(self.path, {"entries": self.entries, "tasks": self.tasks})
+
+
+TRANSFERS = LazyObject(lambda: TransferLedger(os.path.join(STATE_DIR, "transfers.json")))
+
+# 内容寻址产物库：blobs/<前2位>/<sha256> 保存文件内容，目标文件名硬链接到 blob；
+# 索引（保存在 STATE_DIR）记录每个源 fid 的摘要和大小，以及每个目标名当前对应的摘要
+class ArtifactStore:
+    def __init__(self, root, index_path):
+        self.root = root
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        data = load_json(index_path, {})
+        self.sources = data.get("sources", {})
+        self.targets = data.get("targets", {})
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def ingest(self, path, digest, size, target, fid="", name=""):
+        blob = self.blob_path(digest)
+        with self.lock:
+            if os.path.exists(blob) and os.path.getsize(blob) == size:
+                os.remove(path)
+                print(f" 内容已存在，复用 {digest[:12]} → {target}")
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.replace(path, blob)
+            if os.path.lexists(target):
+                os.remove(target)
+            try:
+                os.link(blob, target)
+            except OSError:
+                shutil.copyfile(blob, target)  # 跨文件系统时退化为复制
+            if fid:
+                self.sources[fid] = {"digest": digest, "size": size, "target": target, "name": name}
+            previous = self.targets.get(target)
+            self.targets[target] = digest
+            if previous and previous != digest:
+                self._prune(previous)
+            self.save()
+
+    # 目标文件换成新内容后，旧摘要若已没有目标引用就删除其 blob，并丢弃指向它的源记录
+    # （is_current 要求目标当前摘要一致，这些记录不会再命中），否则常驻模式下产物库会无限增长
+    def _prune(self, digest):
+        if digest in self.targets.values():
+            return
+        for fid in [k for k, v in self.sources.items() if v.get("digest") == digest]:
+            del self.sources[fid]
+        blob = self.blob_path(digest)
+        if os.path.exists(blob):
+            os.remove(blob)
+            print(f" 删除不再引用的产物 {digest[:12]}")
+
+    def source(self, fid):
+        with self.lock:
+            return dict(self.sources.get(fid) or {})
+
+    # target 当前内容是否正是该源 fid 的产物（用于判断已存在的同名文件能否跳过）
+    def is_current(self, target, fid, size=0):
+        rec = self.source(fid)
+        if not rec or rec.get("target") != target or (size and rec.get("size") != size):
+            return False
+        with self.lock:
+            if self.targets.get(target) != rec.get("digest"):
+                return False
+        return os.path.exists(target) and os.path.getsize(target) == rec.get("size")
+
+    def save(self):
+        atomic_write_json(self.index_path, {"sources": self.sources, "targets": self.targets})
+
+
+ARTIFACTS = LazyObject(lambda: ArtifactStore(ARTIFACT_DIR, os.path.join(STATE_DIR, "artifacts.json")))
 
 # ===== 判断是否需要下载 =====
-def should_download(filename):
+def should_download(filename, expected_size=0, fid=None):
+    if fid and os.path.exists(filename) and not ARTIFACTS.is_current(filename, fid, expected_size):
+        print(f"同名文件不是该源文件的产物，重新下载: {filename}")
+        return True
     if os.path.exists(filename):
-        size_mb = os.path.getsize(filename) / (1024 * 1024)
+        actual = os.path.getsize(filename)
+        if expected_size and actual != expected_size:
+            print(f"文件大小不符，重新下载: {filename} ({actual:,} / {expected_size:,} B)")
+            return True
+        size_mb = actual / (1024 * 1024)
         print(f"文件已存在，跳过下载: {filename} ({size_mb:.2f} MB)")
         return False
     return True
 
 # ===== 从 TXT 提取版本号和更新日志（更鲁棒版） =====
-def extract_version_and_changelog(txt_path, edition="OK"):
-    try:
-        with open(txt_path, 'r', encoding='utf-8') as f:
-            content = f.read().strip()
-
-        print(f"\n=== TXT 文件内容预览 ({os.path.basename(txt_path)}) 前800字符 ===")
-        print(content[:800] + ("..." if len(content) > 800 else ""))
-        print("=== TXT 内容预览结束 ===\n")
-
-        # 提取版本号
-        version_patterns = [
-            r'(?:版本|v|Ver|Version|build)\s*[:]?[\s]*([vV]?\d+\.\d+\.\d+(?:[-_][a-zA-Z0-9]+)?)',
-            r'(\d+\.\d+\.\d+(?:[-_][a-zA-Z0-9]+)?)',
-            r'v?(\d+\.\d+\.\d+)',
-        ]
-        version = "未知版本"
-        for pat in version_patterns:
-            m = re.search(pat, content, re.IGNORECASE)
-            if m:
-                version = m.group(1).strip()
-                break
+TXT_MAX_BYTES = 4 * 1024 * 1024  # 更新日志最多读取的字节数
+
+# 带关键词的版本号优先，其次取第一个 x.y.z
+VERSION_RE = re.compile(
+    r'(?:版本|v|Ver|Version|build)\s*[:]?[\s]*(?P<kw>[vV]?\d+\.\d+\.\d+(?:[-_][a-zA-Z0-9]+)?)'
+    r'|(?P<plain>\d+\.\d+\.\d+(?:[-_][a-zA-Z0-9]+)?)',
+    re.IGNORECASE,
+)
+CHANGELOG_RE = re.compile(
+    r"(?:更新日志|更新内容|变更日志|更新说明|What's new|新版本特性|本次更新|更新记录)[:：]?",
+    re.IGNORECASE,
+)
+BLANK_LINES_RE = re.compile(r'\n{3,}')
 
-        # 提取更新日志 - 更宽松：找不到关键词就取全部
-        changelog_keywords = [
-            r'更新日志[:]?',
-            r'更新内容[:]?',
-            r'变更日志[:]?',
-            r'更新说明[:]?',
-            r"What's new[:]?",
-            r'新版本特性[:]?',
-            r'本次更新[:]?',
-            r'更新记录[:]?',
-        ]
-        changelog_start = 0  # 默认从头取
-        for kw in changelog_keywords:
-            m = re.search(kw, content, re.IGNORECASE)
-            if m:
-                changelog_start = m.end()  # 从关键词后开始取
+def _detect_encoding(head):
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith(codecs.BOM_UTF16_LE) or head.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16"
+    return "utf-8"
+
+# 边接收边解码：按 BOM 选择编码，UTF-8 解码失败时改为接收完后整体按 GB18030（GBK 超集）解码
+def decode_text_stream(chunks, limit=TXT_MAX_BYTES):
+    raw = bytearray()
+    parts = []
+    decoder = None
+    fallback = False
+    for chunk in chunks:
+        chunk = chunk[:max(0, limit - len(raw))]
+        if not chunk:
+            if len(raw) >= limit:
                 break
+            continue
+        raw += chunk
+        if fallback:
+            continue
+        if decoder is None:
+            if len(raw) < 3:
+                continue
+            decoder = codecs.getincrementaldecoder(_detect_encoding(raw))()
+            chunk = bytes(raw)
+        try:
+            parts.append(decoder.decode(chunk))
+        except UnicodeDecodeError:
+            fallback = True
+    if not fallback:
+        try:
+            if decoder is None:
+                return raw.decode("utf-8")
+            parts.append(decoder.decode(b"", final=True))
+            return "".join(parts)
+        except UnicodeDecodeError:
+            pass
+    return raw.decode("gb18030", errors="replace")
 
-        changelog = content[changelog_start:].strip()
-        if not changelog or len(changelog) < 20:
-            changelog = content.strip()  # 如果太短，直接取全部
+def parse_version_and_changelog(content, source_name=""):
+    content = content.strip()
+    print(f"\n=== TXT 文件内容预览 ({source_name}) 前800字符 ===")
+    print(content[:800] + ("..." if len(content) > 800 else ""))
+    print("=== TXT 内容预览结束 ===\n")
 
-        changelog = re.sub(r'\n{3,}', '\n\n', changelog).strip()
+    # 提取版本号：一次扫描，遇到带关键词的立即采用，否则用第一个纯数字版本
+    version = None
+    for m in VERSION_RE.finditer(content):
+        if m.group("kw"):
+            version = m.group("kw")
+            break
+        if version is None:
+            version = m.group("plain")
+    version = version.strip() if version else "未知版本"
 
-        return version, changelog, os.path.basename(txt_path)
+    # 提取更新日志 - 更宽松：找不到关键词就取全部
+    m = CHANGELOG_RE.search(content)
+    changelog = content[m.end():].strip() if m else content
+    if not changelog or len(changelog) < 20:
+        changelog = content  # 如果太短，直接取全部
 
-    except FileNotFoundError:
-        print(f"TXT 文件不存在: {txt_path}")
-        return "无 TXT 下载", "没有下载到更新日志文件", "无"
-    except Exception as e:
-        print(f"读取或解析 {txt_path} 失败: {str(e)}")
-        return "提取失败", "无法读取 TXT 文件内容", os.path.basename(txt_path)
+    changelog = BLANK_LINES_RE.sub('\n\n', changelog).strip()
+    return version, changelog
 
-# ===== 获取下载链接 + 下载 + 强制生成 Version 文件 =====
-def get_original_download(fid, share_fid_token="", name="", size=0, is_txt=False):
-    if not COOKIE:
-        print(f" 无 COOKIE，跳过 {fid[:8]}")
-        return [], ""
+# 更新日志库：JSONL 追加写，同一版本号只保留一条（内容变化时追加新行，加载时后写的覆盖先写的）；
+# 行数超过 CHANGELOG_MAX 的两倍时压缩为最新 CHANGELOG_MAX 条。新旧按版本号排序，与写入顺序无关
+class ChangelogStore:
+    def __init__(self, path, max_entries=CHANGELOG_MAX):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.lines = 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.lines += 1
+                    self.entries[entry["key"]] = entry
+        except OSError:
+            pass
 
-    with FILES_LOCK:
-        if fid in FILES_CACHE:
-            c = FILES_CACHE[fid]
-            if c.get("ori_urls") and c.get("expires", 0) > time.time():
-                print(f" 缓存命中 {fid[:8]}")
-                return c["ori_urls"], c.get("cookies", "")
+    @staticmethod
+    def key(version, changelog):
+        if re.match(r"^[vV]?\d", version or ""):
+            return version.lower().lstrip("v")
+        return f"{version}#{hashlib.sha1(changelog.encode('utf-8')).hexdigest()[:8]}"
 
-    print(f" 开始获取链接 {fid[:8]}...")
-    direct_url = "https://drive-pc.quark.cn/1/clouddrive/file/download?pr=ucpro&fr=pc"
-    direct_payload = {"fids": [fid], "pwd_id": PWD_ID, "stoken": STOKEN}
-    print(f" 尝试直接下载 {fid[:8]}...")
+    # 版本号中的数字段逐段比较（同 folder_version_key），相同或没有版本号时比较来源 TXT 的更新时间
+    @staticmethod
+    def order(entry):
+        numbers = tuple(int(n) for n in re.findall(r"\d+", entry.get("version") or ""))
+        return numbers, entry.get("updated_at") or 0
+
+    # 返回 False 表示该版本已记录且内容未变；updated_at 为来源 TXT 的更新时间
+    def add(self, version, changelog, source="", updated_at=0):
+        key = self.key(version, changelog)
+        with self.lock:
+            old = self.entries.get(key)
+            if old and old.get("changelog") == changelog:
+                return False
+            entry = {
+                "key": key,
+                "version": version,
+                "source": source,
+                "fetched_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "updated_at": updated_at,
+                "changelog": changelog,
+            }
+            self.entries[key] = entry
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.lines += 1
+            if self.lines > 2 * self.max_entries:
+                self._compact()
+            return True
+
+    def _compact(self):
+        kept = sorted(self.entries.values(), key=self.order)[-self.max_entries:]
+        self.entries = {e["key"]: e for e in kept}
+        atomic_write_text(self.path, "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in kept))
+        self.lines = len(kept)
+
+    def latest(self, n=CHANGELOG_KEEP):
+        with self.lock:
+            return sorted(self.entries.values(), key=self.order, reverse=True)[:max(0, n)]
+
+    # 最新的条目在前，整体覆盖写入
+    def render(self, path, n=CHANGELOG_KEEP, missing_source=""):
+        entries = self.latest(n)
+        parts = []
+        for entry in entries:
+            parts.append(
+                f"{'='*70}\n"
+                f"版本: {entry['version']}\n"
+                f"来源文件名: {entry.get('source', '')}\n"
+                f"提取时间: {entry.get('fetched_at', '')}\n"
+                + "-" * 70 + "\n\n"
+                "更新日志:\n\n"
+                f"{entry['changelog'] or '未提取到更新日志内容（TXT 可能为空或格式异常）'}\n"
+            )
+        if not parts:
+            parts.append(
+                f"{'='*70}\n"
+                "版本: 无 TXT 下载\n"
+                f"来源文件名: {missing_source}\n"
+                f"提取时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                + "-" * 70 + "\n\n"
+                "更新日志:\n"
+                "没有下载到更新日志 TXT 文件，请检查分享目录\n"
+            )
+        atomic_write_text(path, "\n".join(parts))
+        return len(entries)
+
+
+_CHANGELOGS = {}
+_CHANGELOGS_LOCK = threading.Lock()
+
+def changelog_store(edition):
+    with _CHANGELOGS_LOCK:
+        if edition not in _CHANGELOGS:
+            _CHANGELOGS[edition] = ChangelogStore(os.path.join(STATE_DIR, f"changelog-{edition}.jsonl"))
+        return _CHANGELOGS[edition]
+
+# ===== 并发下载调度 =====
+# 令牌桶限速：rate 为每秒补充的令牌数，burst 为桶容量
+class TokenBucket:
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# 有界线程池 + 单域名并发上限 + 令牌桶限速
+class DownloadScheduler:
+    def __init__(self, workers=DOWNLOAD_WORKERS, per_host=PER_HOST_LIMIT, rate=DOWNLOAD_RATE, burst=DOWNLOAD_BURST):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="dl")
+        self.per_host = max(1, per_host)
+        self.bucket = TokenBucket(rate, burst)
+        self.host_sems = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def host_slot(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            sem = self.host_sems.get(host)
+            if sem is None:
+                sem = self.host_sems[host] = threading.BoundedSemaphore(self.per_host)
+        with sem:
+            yield
+
+    def throttle(self):
+        self.bucket.acquire()
+
+    def submit(self, fn, *args, **kwargs):
+        return self.pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
+
+
+SCHEDULER = LazyObject(lambda: DownloadScheduler(workers=CONFIG.concurrency["downloads"]))
+
+# ===== 分段 / 断点续传下载 =====
+class RangeNotSupported(Exception):
+    pass
+
+
+# 下载内容不可信（大小不符、错误页、zip 结构损坏）
+class IntegrityError(Exception):
+    pass
+
+
+# 边下载边计算 sha256：按偏移喂入数据，乱序到达的分片先缓冲，超出 HASH_BUFFER_MAX 后放弃缓冲，
+# 结束时从文件补读未计算的部分（仅断点续传或极端乱序时发生）
+class StreamingHasher:
+    def __init__(self, buffer_limit=HASH_BUFFER_MAX):
+        self.sha = hashlib.sha256()
+        self.cursor = 0
+        self.pending = {}
+        self.buffered = 0
+        self.limit = buffer_limit
+        self.spilled = False
+        self.lock = threading.Lock()
+
+    def feed(self, offset, data):
+        with self.lock:
+            if self.spilled or offset + len(data) <= self.cursor:
+                return
+            if offset <= self.cursor:
+                self.sha.update(data[self.cursor - offset:])
+                self.cursor = offset + len(data)
+                self._drain()
+            elif self.buffered + len(data) > self.limit:
+                self.spill()
+            else:
+                self.buffered += len(data) - len(self.pending.get(offset, b""))
+                self.pending[offset] = bytes(data)  # 调用方的缓冲区会被复用，必须复制
+
+    def _drain(self):
+        while self.pending:
+            offset = self.cursor if self.cursor in self.pending else next((o for o in self.pending if o < self.cursor), None)
+            if offset is None:
+                return
+            data = self.pending.pop(offset)
+            self.buffered -= len(data)
+            if offset + len(data) > self.cursor:
+                self.sha.update(data[self.cursor - offset:])
+                self.cursor = offset + len(data)
+
+    def spill(self):
+        self.spilled = True
+        self.pending.clear()
+        self.buffered = 0
 
-    urls = []
-    cookies_str = ""
+    def finish(self, path, size):
+        if self.cursor < size:
+            with open(path, "rb") as f:
+                f.seek(self.cursor)
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    self.sha.update(block)
+        return self.sha.hexdigest()
+
+
+# 进度显示：按时间节流合并更新；关闭时不创建 tqdm，update 几乎无开销
+def progress_enabled():
+    if PROGRESS in ("on", "off"):
+        return PROGRESS == "on"
+    return sys.stderr.isatty() and not os.getenv("CI")
+
+
+class Progress:
+    def __init__(self, desc, total, initial=0, enabled=None, file=None):
+        self.bar = None
+        self.pending = 0
+        self.last = 0.0
+        self.lock = threading.Lock()
+        if progress_enabled() if enabled is None else enabled:
+            from tqdm import tqdm
+
+            self.bar = tqdm(desc=desc, total=total, initial=initial, unit='B', unit_scale=True, unit_divisor=1024,
+                            mininterval=PROGRESS_INTERVAL, file=file)
+
+    def update(self, n):
+        if self.bar is None:
+            return
+        with self.lock:
+            self.pending += n
+            now = time.monotonic()
+            if now - self.last >= PROGRESS_INTERVAL:
+                self.bar.update(self.pending)
+                self.pending = 0
+                self.last = now
+
+    def close(self):
+        if self.bar is not None:
+            with self.lock:
+                self.bar.update(self.pending)
+                self.pending = 0
+            self.bar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_BUFFERS = threading.local()
+
+# 每个线程一块可复用的读缓冲区
+def _read_buffer():
+    buf = getattr(_BUFFERS, "view", None)
+    if buf is None or len(buf) < CHUNK_MAX:
+        buf = _BUFFERS.view = memoryview(bytearray(CHUNK_MAX))
+    return buf
+
+
+# 把响应体读入可复用缓冲区，逐块交给 sink(view, offset)；view 仅在回调期间有效。返回读到的字节数。
+# 读到结尾后把连接交还连接池：requests 只在 iter_content 读完时才认为内容已消费，否则关闭响应会直接断开连接。
+# 请求已带 Accept-Encoding: identity；服务器仍压缩时由 urllib3 解码，避免把压缩数据写入文件
+def pump(r, sink, progress, offset=0):
+    buf = _read_buffer()
+    r.raw.decode_content = True
+    readinto = r.raw.readinto
+    chunk = CHUNK_MIN
+    start = offset
+    while True:
+        n = readinto(buf[:chunk])
+        if not n:
+            break
+        sink(buf[:n], offset)
+        offset += n
+        progress.update(n)
+        if n == chunk and chunk < CHUNK_MAX:
+            chunk = min(CHUNK_MAX, chunk * 2)
+        elif n < chunk // 4 and chunk > CHUNK_MIN:
+            chunk //= 2
+    r.raw.release_conn()
+    return offset - start
+
+
+def _pwrite(fd, data, offset, lock):
+    if hasattr(os, "pwrite"):
+        while data:
+            n = os.pwrite(fd, data, offset)
+            data = data[n:]
+            offset += n
+        return
+    with lock:  # Windows 无 pwrite，退化为 seek + write
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+
+# 进度文件须属于同一源文件（目标名跨版本不变，同样大小的新版本不能接着旧版本的 .part 续传）
+def _load_progress(sidecar, size, segment, fid=""):
     try:
-        r = requests.post(direct_url, json=direct_payload, headers=HEADERS, timeout=30)
-        print(f" 直接下载状态码: {r.status_code}")
-        if r.status_code == 200:
-            data = r.json()
-            if "data" in data and isinstance(data["data"], list):
-                for item in data["data"]:
-                    if "download_url" in item and item["download_url"]:
-                        urls.append(item["download_url"])
-            if urls:
-                cookies_str = "; ".join([f"{k}={v}" for k, v in r.cookies.items()])
-                expires = time.time() + 86400
-                with FILES_LOCK:
-                    FILES_CACHE[fid] = {"ori_urls": urls, "cookies": cookies_str, "expires": expires, "done": False}
-                print(f" 直接下载成功 ({len(urls)} 条链接)")
+        with open(sidecar, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("size") == size and state.get("segment") == segment and state.get("fid", "") == fid:
+            return set(state.get("done", []))
+    except (OSError, ValueError):
+        pass
+    return set()
+
+
+def _fetch_segment(url, headers, fd, start, end, pbar, write_lock, hasher):
+    h = dict(headers)
+    h["Range"] = f"bytes={start}-{end}"
+    last_err = None
+    for attempt in range(SEGMENT_RETRIES):
+        written = [start]
+
+        def sink(view, offset):
+            _pwrite(fd, view, offset, write_lock)
+            hasher.feed(offset, view)
+            written[0] = offset + len(view)
+
+        try:
+            with CLIENT.get(url, "file", retries=0, headers=h, stream=True) as r:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    raise RangeNotSupported(f"HTTP {r.status_code}")
+                pump(r, sink, pbar, start)
+            offset = written[0]
+            METRICS.incr("bytes_downloaded", offset - start, kind="segment")
+            if offset != end + 1:
+                raise IOError(f"段 {start}-{end} 不完整: {offset - start}/{end - start + 1} B")
+            return
+        except RangeNotSupported:
+            raise
+        except Exception as e:
+            last_err = e
+            pbar.update(start - written[0])  # 回退本段进度
+            print(f" 分段 {start}-{end} 第 {attempt + 1} 次失败: {str(e)}")
+            time.sleep(1 + attempt)
+    raise last_err
+
+
+def _download_single(url, headers, part, desc, hasher):
+    with CLIENT.get(url, "file", headers=headers, stream=True) as r:
+        r.raise_for_status()
+        total_size = int(r.headers.get('content-length', 0))
+        with open(part, 'wb', buffering=0) as f, Progress(desc, total_size) as pbar:
+            def sink(view, offset):
+                hasher.feed(offset, view)
+                while view:
+                    view = view[f.write(view):]
+
+            received = pump(r, sink, pbar)
+            METRICS.incr("bytes_downloaded", received, kind="single")
+
+
+def _download_segments(url, headers, part, sidecar, size, desc, hasher, fid=""):
+    segment = max(1, SEGMENT_SIZE)
+    ranges = [(i, start, min(start + segment, size) - 1) for i, start in enumerate(range(0, size, segment))]
+    done = _load_progress(sidecar, size, segment, fid) if os.path.exists(part) else set()
+    if not done:
+        with open(part, "wb") as f:
+            f.truncate(size)  # 预分配
+    todo = [rg for rg in ranges if rg[0] not in done]
+    if done:
+        print(f" 断点续传 {desc}: 已完成 {len(done)}/{len(ranges)} 段")
+        hasher.spill()  # 已完成的段不会再经过内存，结束时统一从文件补算
+
+    progress_lock = threading.Lock()
+    write_lock = threading.Lock()
+    fd = os.open(part, os.O_RDWR | getattr(os, "O_BINARY", 0))
+    try:
+        initial = sum(e - s + 1 for i, s, e in ranges if i in done)
+        with Progress(desc, size, initial=initial) as pbar, \
+                ThreadPoolExecutor(max_workers=max(1, SEGMENT_WORKERS), thread_name_prefix="seg") as pool:
+            def run(rg):
+                i, start, end = rg
+                _fetch_segment(url, headers, fd, start, end, pbar, write_lock, hasher)
+                with progress_lock:
+                    done.add(i)
+                    atomic_write_json(sidecar, {"fid": fid, "size": size, "segment": segment, "done": sorted(done)})
+
+            for fut in [pool.submit(run, rg) for rg in todo]:
+                fut.result()
+    finally:
+        os.close(fd)
+
+
+# 下载前探测：1 字节 Range 请求，返回 (总大小或 None, Content-Type, 是否支持 Range)
+def probe_download(url, headers):
+    h = dict(headers)
+    h["Range"] = "bytes=0-0"
+    with CLIENT.get(url, "probe", headers=h, stream=True) as r:
+        r.raise_for_status()
+        ctype = r.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if r.status_code == 206:
+            r.content  # 读完 1 字节的响应体，连接才能交还连接池供后续下载复用
+            total = r.headers.get("Content-Range", "").rpartition("/")[2]
+            return (int(total) if total.isdigit() else None), ctype, True
+        length = r.headers.get("Content-Length", "")
+        return (int(length) if length.isdigit() else None), ctype, False
+
+
+def check_probe(total, ctype, size):
+    if ctype.startswith(BAD_CONTENT_TYPES):
+        raise IntegrityError(f"响应类型为 {ctype}，不是安装包")
+    if size and total is not None and total != size:
+        raise IntegrityError(f"服务器报告大小 {total:,} B，列表中为 {size:,} B")
+
+
+# APK 即 zip：检查文件头，并从末尾找到中央目录结束记录（EOCD），确认中央目录完整落在文件内
+def validate_apk(path):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if f.read(4) != b"PK\x03\x04":
+            raise IntegrityError("文件头不是 zip")
+        tail_len = min(size, 22 + 65535)  # EOCD 22 字节 + 最长注释
+        f.seek(size - tail_len)
+        tail = f.read(tail_len)
+        pos = tail.rfind(b"PK\x05\x06")
+        if pos < 0 or pos + 22 > len(tail):
+            raise IntegrityError("缺少中央目录结束记录，文件可能被截断")
+        cd_size, cd_offset = struct.unpack("<II", tail[pos + 12:pos + 20])
+        if cd_offset == 0xFFFFFFFF:
+            return  # zip64，交给安装器校验
+        if cd_offset + cd_size > size - tail_len + pos:
+            raise IntegrityError(f"中央目录越界: offset={cd_offset}, size={cd_size}")
+        if cd_size:
+            f.seek(cd_offset)
+            if f.read(4) != b"PK\x01\x02":
+                raise IntegrityError("中央目录签名不符")
+
+
+# 校验失败的文件移入隔离区（附原因），只保留最近 QUARANTINE_KEEP 个
+def quarantine(part, filename, reason):
+    os.makedirs(QUARANTINE_DIR, exist_ok=True)
+    dest = os.path.join(QUARANTINE_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.path.basename(filename)}")
+    if os.path.exists(part):
+        shutil.move(part, dest)
+    atomic_write_json(dest + ".json", {"target": filename, "reason": reason, "at": int(time.time())})
+    kept = sorted(n for n in os.listdir(QUARANTINE_DIR) if not n.endswith(".json"))
+    for old in kept[:-QUARANTINE_KEEP]:
+        for path in (old, old + ".json"):
+            if os.path.exists(os.path.join(QUARANTINE_DIR, path)):
+                os.remove(os.path.join(QUARANTINE_DIR, path))
+    METRICS.incr("quarantined")
+    print(f" 已隔离 {filename}: {reason} → {dest}")
+
+
+# 下载到 <filename>.part，校验大小与 zip 结构后存入产物库并链接为 filename；中断时保留 .part 与进度文件，下次只补缺失的段；
+# 校验失败时 .part 移入隔离区并抛出 IntegrityError
+@timed("download")
+def download_file(url, headers, filename, size=0, fid="", name=""):
+    headers = dict(headers, **{"Accept-Encoding": "identity"})  # 分段和大小校验都针对原始字节
+    part = filename + ".part"
+    sidecar = part + ".json"
+    ranged = True
+    if DOWNLOAD_PROBE:
+        total, ctype, ranged = probe_download(url, headers)
+        check_probe(total, ctype, size)
+        size = size or total or 0
+    hasher = StreamingHasher()
+    if size >= SEGMENT_MIN_SIZE and ranged:
+        try:
+            _download_segments(url, headers, part, sidecar, size, filename, hasher, fid)
+        except RangeNotSupported as e:
+            print(f" 服务器不支持 Range ({str(e)})，改为单连接下载 {filename}")
+            hasher = StreamingHasher()
+            _download_single(url, headers, part, filename, hasher)
+    else:
+        _download_single(url, headers, part, filename, hasher)
+
+    actual = os.path.getsize(part)
+    try:
+        if size and actual != size:
+            raise IntegrityError(f"大小不符: {actual:,} / {size:,} B")
+        if filename.endswith(".apk"):
+            validate_apk(part)
+    except IntegrityError as e:
+        quarantine(part, filename, str(e))
+        if os.path.exists(sidecar):
+            os.remove(sidecar)
+        raise
+    digest = hasher.finish(part, actual)
+    ARTIFACTS.ingest(part, digest, actual, filename, fid, name)
+    if os.path.exists(sidecar):
+        os.remove(sidecar)
+    return digest
+
+# ===== 获取下载链接 + 下载 + 强制生成 Version 文件 =====
+# 按 LINK_BATCH_MAX 分批请求 file/download，返回 {fid: (urls, cookies)}；pwd_id 为 None 时 fids 是个人网盘中的转存副本
+@timed("fetch_download_links")
+def fetch_download_links(fids, pwd_id=PWD_ID):
+    url = f"{DRIVE_PC_API}/1/clouddrive/file/download?pr=ucpro&fr=pc"
+    batch = max(1, LINK_BATCH_MAX)
+    result = {}
+    for i in range(0, len(fids), batch):
+        chunk = fids[i:i + batch]
+        label = chunk[0][:8] if len(chunk) == 1 else f"{len(chunk)} 个文件"
+        try:
+            if pwd_id:
+                r, _ = call_with_stoken(pwd_id, lambda stoken: CLIENT.post(
+                    url, "download_link", json={"fids": chunk, "pwd_id": pwd_id, "stoken": stoken},
+                    headers=get_headers()))
             else:
-                print(" 直接下载无有效 url")
+                r = CLIENT.post(url, "download_link", json={"fids": chunk}, headers=get_headers())
+            print(f" 获取下载链接 {label} 状态码: {r.status_code}")
+            if r.status_code != 200:
+                print(f" 获取下载链接失败 {label}: {r.text[:200]}...")
+                continue
+            data = r.json()
+            items = data["data"] if isinstance(data.get("data"), list) else []
+            cookies_str = "; ".join([f"{k}={v}" for k, v in r.cookies.items()])
+            urls_by_fid = {}
+            for pos, item in enumerate(items):
+                if not item.get("download_url"):
+                    continue
+                if item.get("fid") in chunk:
+                    key = item["fid"]
+                elif len(chunk) == 1:
+                    key = chunk[0]
+                elif len(items) == len(chunk):
+                    key = chunk[pos]
+                else:
+                    continue
+                urls_by_fid.setdefault(key, []).append(item["download_url"])
+            for fid, urls in urls_by_fid.items():
+                result[fid] = (urls, cookies_str)
+            print(f" 获取下载链接 {label}: {len(urls_by_fid)}/{len(chunk)} 个成功")
+        except Exception as e:
+            print(f" 获取下载链接异常 {label}: {str(e)}")
+    return result
+
+def resolve_direct(fid, pwd_id=PWD_ID):
+    print(f" 尝试直接下载 {fid[:8]}...")
+    urls, cookies_str = fetch_download_links([fid], pwd_id).get(fid, ([], ""))
+    if urls:
+        FILES_CACHE.put(fid, urls, cookies_str)
+    return urls, cookies_str
+
+def resolve_transferred(fid, local_fid):
+    print(f" 请求转码下载链接 {fid[:8]} (local_fid={local_fid[:8]})...")
+    urls, cookies_str = fetch_download_links([local_fid], None).get(local_fid, ([], ""))
+    if urls:
+        FILES_CACHE.put(fid, urls, cookies_str, local_fid=local_fid)
+    return urls, cookies_str
+
+def resolve_cached(fid):
+    cached = FILES_CACHE.get(fid)
+    if not cached:
+        return None
+    local_fid = cached.get("local_fid")
+    print(f" 缓存命中 {fid[:8]}" + (f" (local_fid={local_fid[:8]})" if local_fid else ""))
+    return cached["ori_urls"], cached.get("cookies", "")
+
+# 缓存 → 直接下载 → 转存备用
+def resolve_download(fid, share_fid_token="", pwd_id=PWD_ID):
+    links = resolve_cached(fid)
+    if links:
+        return links
+    urls, cookies_str = resolve_direct(fid, pwd_id)
+    if urls:
+        return urls, cookies_str
+    print(f" 直接下载失败，尝试转存 {fid[:8]}...")
+    local_fid = copy_file(fid, share_fid_token, pwd_id)
+    if not local_fid:
+        print(f" 转存失败，无法继续 {fid[:8]}")
+        return [], ""
+    return resolve_transferred(fid, local_fid)
+
+# 缓存 + 分享直链：按分享分批获取，返回 ({fid: (urls, cookies)}, 未解析到链接的文件)
+@timed("resolve_share_links")
+def resolve_share_links(files):
+    links = {}
+    misses = []
+    for f in files:
+        fid = f.get("fid", "")
+        found = resolve_cached(fid)
+        if found:
+            links[fid] = found
         else:
-            print(f" 直接下载失败: {r.text[:200]}...")
-    except Exception as e:
-        print(f" 直接下载异常: {str(e)}")
+            misses.append(f)
+
+    by_share = OrderedDict()
+    for f in misses:
+        by_share.setdefault(CONFIG.share_of(f), []).append(f)
+
+    failed = []
+    for pwd_id, share_files in by_share.items():
+        direct = fetch_download_links([f.get("fid", "") for f in share_files], pwd_id)
+        for f in share_files:
+            fid = f.get("fid", "")
+            if fid in direct:
+                links[fid] = direct[fid]
+                FILES_CACHE.put(fid, *direct[fid])
+            else:
+                failed.append(f)
+    return links, failed
+
+# 转存备用：每个分享的文件合并成一次转存任务，再从个人网盘批量获取副本的链接
+@timed("resolve_transfer_links")
+def resolve_transfer_links(files):
+    links = {}
+    if not files or not get_cookie():
+        return links
+    by_share = OrderedDict()
+    for f in files:
+        by_share.setdefault(CONFIG.share_of(f), []).append((f.get("fid", ""), f.get("share_fid_token", "")))
+    mapping = {}
+    for pwd_id, items in by_share.items():
+        print(f" {len(items)} 个文件直接下载失败，批量转存...")
+        mapping.update(copy_files(items, pwd_id))
+    if mapping:
+        transferred = fetch_download_links(list(mapping.values()), None)
+        for fid, local_fid in mapping.items():
+            if local_fid in transferred:
+                links[fid] = transferred[local_fid]
+                FILES_CACHE.put(fid, *transferred[local_fid], local_fid=local_fid)
+            else:
+                print(f" 无下载链接 {fid[:8]} (local_fid={local_fid[:8]})")
+    return links
+
+@timed("get_original_download")
+def get_original_download(fid, share_fid_token="", name="", size=0, is_txt=False, links=None, pwd_id=PWD_ID, label=None,
+                          updated_at=0):
+    if not get_cookie():
+        print(f" 无 COOKIE，跳过 {fid[:8]}")
+        return [], ""
+
+    urls, cookies_str = links if links is not None else resolve_download(fid, share_fid_token, pwd_id)
 
     if is_txt:
-        edition = 'Pro' if 'Pro版' in name or 'Pro' in name else 'OK'
+        edition = label or ('Pro' if 'Pro版' in name or 'Pro' in name else 'OK')
         final_file = f"Version-{edition}.txt"
         abs_path = os.path.abspath(final_file)
         print(f"准备处理 TXT 版本文件: {abs_path}")
 
-        if urls:
-            temp_filename = f"temp_txt_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-            print(f" 开始下载 TXT: {temp_filename}")
+        stored = False
+        for attempt in range(INTEGRITY_RETRIES + 1):
+            if not urls:
+                break
+            print(f" 开始读取 TXT: {name}")
             try:
-                dl_headers = HEADERS.copy()
+                dl_headers = get_headers()
                 dl_headers["Cookie"] = cookies_str
-                dl_r = requests.get(urls[0], headers=dl_headers, stream=True, timeout=300)
-                dl_r.raise_for_status()
-                with open(temp_filename, 'wb') as f:
-                    for chunk in dl_r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                print(f" TXT 下载完成: {temp_filename}")
-
-                version, changelog, source_name = extract_version_and_changelog(temp_filename, edition)
-
-                with open(final_file, 'a', encoding='utf-8') as vf:
-                    vf.write(f"\n{'='*70}\n")
-                    vf.write(f"版本: {version}\n")
-                    vf.write(f"来源文件名: {source_name}\n")
-                    vf.write(f"提取时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    vf.write("-" * 70 + "\n\n")
-                    vf.write("更新日志:\n\n")
-                    vf.write(changelog if changelog else "未提取到更新日志内容（TXT 可能为空或格式异常）\n")
-                    vf.write("\n\n")
-
-                print(f"版本信息已追加到: {abs_path}")
+                with CLIENT.get(urls[0], "file", headers=dl_headers, stream=True, timeout=300) as dl_r:
+                    dl_r.raise_for_status()
+                    content = decode_text_stream(dl_r.iter_content(chunk_size=65536))
+            except Exception as e:
+                print(f" TXT 下载失败 {name}: {str(e)}")
+                FILES_CACHE.discard(fid)  # 缓存的链接可能已失效（签名过期等）
+                if attempt < INTEGRITY_RETRIES:
+                    print(f" 重新获取下载链接后重试 {name}...")
+                    urls, cookies_str = resolve_download(fid, share_fid_token, pwd_id)
+                continue
+            print(f" TXT 读取完成: {name} ({len(content)} 字符)")
+            try:
+                version, changelog = parse_version_and_changelog(content, name)
+                if changelog_store(edition).add(version, changelog, name, updated_at):
+                    print(f"版本 {version} 已加入更新日志库")
+                else:
+                    print(f"版本 {version} 已记录且内容未变，不重复添加")
+                stored = True
                 print(f"最新日志预览: {changelog[:200]}...")
-
-                try:
-                    os.remove(temp_filename)
-                except:
-                    pass
-
             except Exception as e:
-                print(f" TXT 下载/处理失败 {name}: {str(e)}")
-
-        # 无论下载成功与否，都确保文件存在
-        if not os.path.exists(final_file):
-            print(f"警告: 未下载到 TXT，强制生成空日志文件 {final_file}")
-            with open(final_file, 'a', encoding='utf-8') as vf:
-                vf.write(f"\n{'='*70}\n")
-                vf.write(f"版本: 无 TXT 下载\n")
-                vf.write(f"来源文件名: {name}\n")
-                vf.write(f"提取时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                vf.write("-" * 70 + "\n\n")
-                vf.write("更新日志:\n")
-                vf.write("没有下载到更新日志 TXT 文件，请检查分享目录\n\n")
+                print(f" TXT 处理失败 {name}: {str(e)}")
+            break
 
-        return urls, cookies_str
+        # 无论下载成功与否，都按日志库重新生成文件（日志库为空时写入提示）
+        count = changelog_store(edition).render(final_file, missing_source=name)
+        print(f"已生成 {abs_path}（最新 {count} 条）")
+
+        # 只有日志写入（或确认已在）日志库才算成功；失败时返回空链接，调用方不会记为完成，下次重试
+        return (urls if stored else []), cookies_str
 
     else:
-        # APK 下载部分（保持不变）
-        filename = name
-        for pattern, new_name in PRO_RENAME_MAP.items():
-            if re.search(pattern, name):
-                filename = new_name
-                break
-        else:
-            for pattern, new_name in OK_RENAME_MAP.items():
-                if re.search(pattern, name):
-                    filename = new_name
-                    break
-        if filename == name:
-            filename = name.replace(".apk", "").replace(" ", "_").replace("/", "_") + ".apk"
-        else:
+        # APK 下载部分
+        filename = CLASSIFIER.target_name(name)
+        if CLASSIFIER.edition_of(name):
             print(f" 重命名: {name} → {filename}")
 
-        if not should_download(filename):
+        if not should_download(filename, size, fid):
+            return urls, cookies_str
+
+        if not urls:
+            print(f" 无下载链接，跳过 {filename}")
             return urls, cookies_str
 
         print(f" 开始下载: {filename} ({size:,} bytes)")
-        try:
-            print("等待 4 秒，避免触发下载限速...")
-            time.sleep(4)
-            dl_headers = HEADERS.copy()
-            dl_headers["Cookie"] = cookies_str
-            dl_r = requests.get(urls[0], headers=dl_headers, stream=True, timeout=600)
-            dl_r.raise_for_status()
-            total_size = int(dl_r.headers.get('content-length', 0))
-            with open(filename, 'wb') as f, tqdm(
-                desc=filename,
-                total=total_size,
-                unit='B',
-                unit_scale=True,
-                unit_divisor=1024,
-            ) as pbar:
-                for chunk in dl_r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        pbar.update(len(chunk))
-            file_size_mb = os.path.getsize(filename) / (1024 * 1024)
-            print(f" 下载完成: {filename} ({file_size_mb:.2f} MB)")
-        except Exception as e:
-            print(f" 下载失败 {filename}: {str(e)}")
+        for attempt in range(INTEGRITY_RETRIES + 1):
+            try:
+                dl_headers = get_headers()
+                dl_headers["Cookie"] = cookies_str
+                with SCHEDULER.host_slot(urls[0]):
+                    with METRICS.span("throttle"):
+                        SCHEDULER.throttle()  # 令牌桶限速，避免触发下载限速
+                    digest = download_file(urls[0], dl_headers, filename, size, fid, name)
+                file_size_mb = os.path.getsize(filename) / (1024 * 1024)
+                print(f" 下载完成: {filename} ({file_size_mb:.2f} MB, sha256={digest[:12]})")
+                break
+            except Exception as e:
+                print(f" {'校验失败' if isinstance(e, IntegrityError) else '下载失败'} {filename}: {str(e)}")
+                FILES_CACHE.discard(fid)  # 缓存的链接可能已失效（签名过期、404 等），不再复用
+                if attempt == INTEGRITY_RETRIES:
+                    break
+                print(f" 重新获取下载链接后重试 {filename}...")
+                urls, cookies_str = resolve_download(fid, share_fid_token, pwd_id)
+                if not urls:
+                    break
 
         return urls, cookies_str
 
-    # 转存备用（如果直接下载失败）
-    print(f" 直接下载失败，尝试转存 {fid[:8]}...")
-    local_fid = copy_file(fid, share_fid_token)
-    if not local_fid:
-        print(f" 转存失败，无法继续 {fid[:8]}")
-        return [], ""
-
-    url = "https://drive-pc.quark.cn/1/clouddrive/file/download?pr=ucpro&fr=pc"
-    payload = {"fids": [local_fid]}
-    print(f" 请求转码下载链接 {fid[:8]} (local_fid={local_fid[:8]})...")
+# ===== 删除转存文件 =====
+# 一次 file/delete 删除一批转存副本；成功后从台账移除并丢弃指向它们的缓存链接，失败的留待下次
+def delete_transferred(local_fids):
+    delete_url = f"{DRIVE_PC_API}/1/clouddrive/file/delete?pr=ucpro&fr=pc"
+    payload = {"action_type": 2, "filelist": local_fids, "exclude_fids": []}
     try:
-        r = requests.post(url, json=payload, headers=HEADERS, timeout=60)
-        r.raise_for_status()
-        data = r.json()
-        urls = []
-        if "data" in data and isinstance(data["data"], list):
-            for item in data["data"]:
-                if "download_url" in item and item["download_url"]:
-                    urls.append(item["download_url"])
-        if not urls:
-            print(f" 无下载链接 {fid[:8]}")
-            return [], ""
-        cookies_str = "; ".join([f"{k}={v}" for k, v in r.cookies.items()])
-        expires = time.time() + 86400
-        with FILES_LOCK:
-            FILES_CACHE[fid] = {"local_fid": local_fid, "ori_urls": urls, "cookies": cookies_str, "expires": expires, "done": False}
-        print(f" 获取成功 {fid[:8]} ({len(urls)} 条链接)")
-        return urls, cookies_str
+        r = CLIENT.post(delete_url, "delete", idempotent=False, json=payload, headers=get_headers())
+        data = r.json() if r.status_code == 200 else {}
     except Exception as e:
-        print(f" 获取链接失败 {fid[:8]}: {str(e)}")
-        return [], ""
+        print(f"删除转存文件失败 ({len(local_fids)} 个): {str(e)}")
+        return False
+    if r.status_code != 200 or data.get("code") not in (0, None):
+        print(f"删除转存文件失败 ({len(local_fids)} 个): 状态码 {r.status_code}, code={data.get('code')}")
+        return False
+    TRANSFERS.remove(local_fids)
+    FILES_CACHE.discard_local(local_fids)
+    METRICS.incr("transfers_deleted", len(local_fids))
+    print(f"已删除 {len(local_fids)} 个转存文件")
+    return True
 
-# ===== 删除转存文件 =====
-def cleanup_transferred_files():
-    if not COOKIE:
-        print("无 COOKIE，跳过清理")
+# 后台清理线程：下载结束的文件释放其转存副本，与剩余下载并行地分批删除
+class TransferCleaner:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pending = []
+        self.inflight = 0
+        self.flushing = False
+        self.thread = None
+
+    def release(self, fid):
+        self.enqueue(TRANSFERS.local_fids(fid))
+
+    def enqueue(self, local_fids):
+        if not local_fids or not get_cookie():
+            return
+        with self.cond:
+            self.pending.extend(lf for lf in local_fids if lf not in self.pending)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, name="cleanup", daemon=True)
+                self.thread.start()
+            self.cond.notify_all()
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                deadline = time.monotonic() + DELETE_LINGER
+                while len(self.pending) < DELETE_BATCH and not self.flushing:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                if not self.pending:
+                    self.thread = None
+                    return
+                batch, self.pending = self.pending[:DELETE_BATCH], self.pending[DELETE_BATCH:]
+                self.inflight += 1
+            try:
+                delete_transferred(batch)
+            finally:
+                with self.cond:
+                    self.inflight -= 1
+                    self.cond.notify_all()
+
+    # 立即发出所有待删批次并等待完成
+    def drain(self):
+        with self.cond:
+            self.flushing = True
+            self.cond.notify_all()
+            while self.pending or self.inflight:
+                self.cond.wait()
+            self.flushing = False
+
+
+CLEANER = TransferCleaner()
+
+# 上次运行崩溃遗留的转存副本：先让缓存中指向它们的链接失效，再交给后台删除
+def reclaim_leftover_transfers():
+    leftovers = TRANSFERS.take_leftovers()
+    if get_cookie():
+        leftovers += collect_timed_out_tasks()
+    if not leftovers:
         return
-    delete_url = "https://drive-pc.quark.cn/1/clouddrive/file/delete?pr=ucpro&fr=pc"
-    with FILES_LOCK:
-        to_delete = [(fid, info["local_fid"]) for fid, info in FILES_CACHE.items()
-                     if not info.get("done") and info.get("expires", 0) < time.time() + 300]
-    for fid, local_fid in to_delete:
-        payload = {"filelist": [local_fid], "action_type": 2, "exclude_fids": []}
+    print(f"回收上次运行遗留的 {len(leftovers)} 个转存文件")
+    FILES_CACHE.discard_local(leftovers)
+    CLEANER.enqueue(leftovers)
+
+# 上次轮询超时的转存任务：查询一次，已完成的把副本登记到台账；失败或超过 TRANSFER_TASK_TTL 的不再追踪
+def collect_timed_out_tasks():
+    found = []
+    for task_id, at in TRANSFERS.pending_tasks().items():
         try:
-            r = requests.post(delete_url, json=payload, headers=HEADERS, timeout=20)
-            if r.status_code == 200:
-                with FILES_LOCK:
-                    if fid in FILES_CACHE:
-                        FILES_CACHE[fid]["done"] = True
-                print(f"删除成功 {local_fid[:8]}")
+            js = query_task(task_id)
         except Exception as e:
-            print(f"删除失败 {local_fid[:8]}: {str(e)}")
+            print(f"查询遗留转存任务失败 {task_id}: {str(e)}")
+            continue
+        top_fids = [lf for lf in js.get("data", {}).get("save_as", {}).get("save_as_top_fids", []) if lf]
+        if top_fids:
+            TRANSFERS.add_unmapped(top_fids)
+            found += top_fids
+        if top_fids or js.get("code") not in (0, None) or time.time() - at > TRANSFER_TASK_TTL:
+            TRANSFERS.remove_task(task_id)
+    return found
+
+# 收尾：台账中仍未删除的副本（包括下载失败的文件）全部提交删除并等待完成
+@timed("cleanup_transferred_files")
+def cleanup_transferred_files():
+    if not get_cookie():
+        print("无 COOKIE，跳过清理")
+        return
+    CLEANER.enqueue(TRANSFERS.local_fids())
+    CLEANER.drain()
+
+# ===== 发布清单 =====
+APK_VERSION_RE = re.compile(r"\d+(?:\.\d+)+")
+
+# 清单（保存在 STATE_DIR）：每个发布资产的版本、架构、大小和摘要，每个下载完成即原子更新；
+# published 为上次确认发布时各资产的摘要，staged 为已放入 RELEASE_DIR 等待确认的摘要
+class ReleaseManifest:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        data = load_json(path, {})
+        self.assets = data.get("assets", {})  # target → {edition, arch, size, sha256, version, fid}
+        self.published = data.get("published", {})
+        self.staged = data.get("staged", {})
+
+    def record(self, target, **fields):
+        with self.lock:
+            if self.assets.get(target) == fields:
+                return
+            self.assets[target] = fields
+            self.save()
+
+    def record_apk(self, f, target):
+        fid = f.get("fid", "")
+        rec = ARTIFACTS.source(fid)
+        if not rec:
+            return
+        name = f.get("file_name", "")
+        c = CLASSIFIER.classify(name)
+        edition = CONFIG.editions.get(c.edition if c else f.get("_edition"))
+        version = APK_VERSION_RE.search(name)
+        self.record(target, edition=edition.label if edition else "", arch=c.arch if c else "",
+                    size=rec["size"], sha256=rec["digest"], version=version.group(0) if version else "", fid=fid)
+
+    def record_file(self, target, edition="", version=""):
+        sha = hashlib.sha256()
+        with open(target, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(block)
+        self.record(target, edition=edition, arch="", size=os.path.getsize(target), sha256=sha.hexdigest(),
+                    version=version, fid="")
+
+    def _unpublished(self, target):
+        return self.assets[target]["sha256"] != self.published.get(target)
+
+    # 尚未确认发布、本地却已不存在的资产（上次上传失败且工作目录是新的），返回其源 fid
+    def unpublished_missing(self):
+        with self.lock:
+            return [a["fid"] for t, a in self.assets.items() if a.get("fid") and self._unpublished(t) and not os.path.exists(t)]
+
+    # 全部 APK 的校验和，不依赖本地是否存在
+    def write_checksums(self, path=CHECKSUM_FILE):
+        with self.lock:
+            lines = [f"{a['sha256']}  {t}\n" for t, a in sorted(self.assets.items()) if t.endswith(".apk")]
+        if lines:
+            with open(path, "w", encoding="utf-8") as f:
+                f.writelines(lines)
+        return len(lines)
+
+    # 把有变化的资产链接到 release_dir，附上完整清单（APK 有变化时再附校验和），返回放入的资产名
+    def stage(self, release_dir=RELEASE_DIR):
+        with self.lock:
+            changed = [t for t in sorted(self.assets) if self._unpublished(t) and os.path.exists(t)]
+            assets = [dict(target=t, **a) for t, a in sorted(self.assets.items())]
+        shutil.rmtree(release_dir, ignore_errors=True)
+        if changed:
+            os.makedirs(release_dir, exist_ok=True)
+            for target in changed:
+                dest = os.path.join(release_dir, os.path.basename(target))
+                try:
+                    os.link(target, dest)
+                except OSError:
+                    shutil.copyfile(target, dest)
+            if any(t.endswith(".apk") for t in changed):
+                self.write_checksums(os.path.join(release_dir, CHECKSUM_FILE))
+            atomic_write_json(os.path.join(release_dir, RELEASE_MANIFEST),
+                              {"generated_at": int(time.time()), "assets": assets})
+        with self.lock:
+            self.staged = {t: self.assets[t]["sha256"] for t in changed}
+            self.save()
+        return changed
+
+    def ack(self):
+        with self.lock:
+            count = len(self.staged)
+            self.published.update(self.staged)
+            self.staged = {}
+            self.save()
+        return count
+
+    def save(self):
+        atomic_write_json(self.path, {"assets": self.assets, "published": self.published, "staged": self.staged})
+
+
+MANIFEST = LazyObject(lambda: ReleaseManifest(os.path.join(STATE_DIR, "release.json")))
+
+# 把本轮有变化的资产放入 RELEASE_DIR，并通过 GITHUB_OUTPUT 告知是否需要发布
+def stage_release():
+    staged = MANIFEST.stage()
+    write_github_output(release="true" if staged else "false")
+    if staged:
+        print(f"\n待发布资产 {len(staged)} 个（{RELEASE_DIR}/）:")
+        for target in staged:
+            print(f"  - {target}")
+    else:
+        print("\n所有资产与上次发布一致，无需上传")
+    return staged
 
 # ===== 主逻辑 =====
-def main():
-    test_personal_drive()
-    all_apks = []
-    download_results = []
-    downloaded_files = []
+# 多个源文件可能映射到同一目标（如 …-1.0.apk 与 …-1.1.apk），每轮只保留最新的源（文件名中的版本号，其次修改时间）。
+# 同一目标的下载与入库串行执行，排队期间被更新的源取代的任务直接放弃，避免并发写同一个 .part 和进度文件
+class TargetClaims:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.best = {}
+        self.locks = {}
 
-    # 第一阶段：OK 标准版 - 只处理指定 3 类
-    print("\n" + "="*70)
-    print("=== 第一阶段：处理 OK 标准版（仅 OK影视-电视版 / OK影视-手机版 / 海信专版） ===")
-    print("="*70 + "\n")
-    latest = get_latest_subfolder(TARGET_DIRS[1])
-    if latest:
-        print(f"最新子文件夹：{latest.get('file_name', '?')}")
-        apks_std, txts_std = get_apks_in_dir(latest["fid"], is_pro=False)
-        for f in txts_std:
-            name = f.get("file_name", "?")
-            size = f.get("size", 0)
-            fid = f.get("fid", "")
-            sft = f.get("share_fid_token", "")
-            print(f" • TXT: {name:<50} {size:>12,} B")
-            urls, ck = get_original_download(fid, sft, name, size, is_txt=True)
-            if urls:
-                downloaded_files.append(f"Version-OK.txt (from {name})")
-        for f in apks_std:
-            name = f.get("file_name", "?")
-            size = f.get("size", 0)
-            fid = f.get("fid", "")
-            sft = f.get("share_fid_token", "")
-            filename = name
-            for pattern, new_name in OK_RENAME_MAP.items():
-                if re.search(pattern, name):
-                    filename = new_name
-                    break
-            if filename == name:
-                filename = name.replace(".apk", "").replace(" ", "_").replace("/", "_") + ".apk"
-            print(f" • {name:<50} {size:>12,} B → 将保存为: {filename}")
-            all_apks.append(f)
-            urls, ck = get_original_download(fid, sft, name, size)
-            if urls:
-                download_results.append({
-                    "name": name,
-                    "size": size,
-                    "fid": fid,
-                    "urls": urls,
-                    "cookies": ck
-                })
-                print(f" → 处理完成 ({len(urls)} 条链接)")
-
-    # 第二阶段：OK Pro 版 - 全部处理
+    # 登记源文件，返回它是否为该目标目前最新的源
+    def offer(self, target, f):
+        key = folder_version_key(f)
+        with self.lock:
+            best = self.best.get(target)
+            if best and best[0] > key:
+                return False
+            self.best[target] = (key, f.get("fid", ""))
+            return True
+
+    def is_best(self, target, fid):
+        with self.lock:
+            best = self.best.get(target)
+            return not best or best[1] == fid
+
+    def hold(self, target):
+        with self.lock:
+            return self.locks.setdefault(target, threading.Lock())
+
+def skip_superseded(f, filename):
+    print(f" • 已有更新的源映射到 {filename}，跳过: {f.get('file_name', '?')}")
+    STATE.mark_done(f, target=filename, superseded=True)
+
+def process_apk(f, filename, link, claims):
+    fid = f.get("fid", "")
+    try:
+        with claims.hold(filename):
+            if not claims.is_best(filename, fid):
+                skip_superseded(f, filename)
+                return [], ""
+            urls, ck = get_original_download(fid, f.get("share_fid_token", ""), f.get("file_name", "?"), f.get("size", 0),
+                                             links=link, pwd_id=CONFIG.share_of(f))
+            if urls and ARTIFACTS.is_current(filename, fid, f.get("size", 0)):
+                STATE.mark_done(f, target=filename)
+                MANIFEST.record_apk(f, filename)
+    finally:
+        CLEANER.release(fid)
+    return urls, ck
+
+# 返回 (文件, future)；同一目标已有更新的源时不提交，future 为 None
+def submit_apk(f, link, claims):
+    name = f.get("file_name", "?")
+    size = f.get("size", 0)
+    filename = CLASSIFIER.target_name(name)
+    if not claims.offer(filename, f):
+        CLEANER.release(f.get("fid", ""))
+        skip_superseded(f, filename)
+        return f, None
+    print(f" • {name:<50} {size:>12,} B → 将保存为: {filename}")
+    return f, SCHEDULER.submit(process_apk, f, filename, link, claims)
+
+def process_txt(f, edition, link, downloaded_files):
+    name = f.get("file_name", "?")
+    size = f.get("size", 0)
+    fid = f.get("fid", "")
+    print(f" • TXT: {name:<50} {size:>12,} B")
+    try:
+        urls, ck = get_original_download(fid, f.get("share_fid_token", ""), name, size, is_txt=True,
+                                         links=link, pwd_id=CONFIG.share_of(f), label=edition,
+                                         updated_at=f.get("updated_at") or f.get("last_update_at") or 0)
+    finally:
+        CLEANER.release(fid)
+    if urls:
+        downloaded_files.append(f"Version-{edition}.txt (from {name})")
+        STATE.mark_done(f, target=f"Version-{edition}.txt")
+    return urls, ck
+
+# 目录内的目标文件全部处理成功后才记录指纹，失败的文件下次仍会被重新检查
+def commit_fingerprints(scanned):
+    done = {}
+    for fps, files in scanned:
+        if fps and all(STATE.is_unchanged(f) for f in files):
+            done.update(fps)
+    if done:
+        STATE.set_dir_fingerprints(done)
+
+def write_github_output(**outputs):
+    path = os.getenv("GITHUB_OUTPUT")
+    if not path:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        for k, v in outputs.items():
+            f.write(f"{k}={v}\n")
+
+# ===== 流水线 =====
+_END = object()
+
+# 批处理阶段：从输入队列凑批（满 batch_size 个或等待 PIPELINE_LINGER 秒）交给 handler，收到结束标记时处理完剩余批次后调用 on_end
+class BatchStage(threading.Thread):
+    def __init__(self, name, inbox, handler, batch_size, on_end=None):
+        super().__init__(name=name, daemon=True)
+        self.inbox = inbox
+        self.handler = handler
+        self.batch_size = max(1, batch_size)
+        self.on_end = on_end or (lambda: None)
+
+    def run(self):
+        batch = []
+        ended = False
+        while not ended:
+            try:
+                item = self.inbox.get(timeout=PIPELINE_LINGER if batch else None)
+            except queue.Empty:
+                item = None
+            if item is _END:
+                ended = True
+            elif item is not None:
+                batch.append(item)
+            if batch and (ended or item is None or len(batch) >= self.batch_size):
+                try:
+                    self.handler(batch)
+                except Exception as e:
+                    print(f" {self.name} 阶段异常 ({len(batch)} 个文件): {str(e)}")
+                batch = []
+        self.on_end()
+
+# 列表线程通过 feed 逐个送入目标文件：未变化的跳过，其余依次经过 链接解析 → 转存备用 → 下载/更新日志。
+# 下载池中排队的任务数受 slots 限制，下游跟不上时各级队列依次写满，列表线程随之阻塞
+class Pipeline:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.changed = 0
+        self.probed = False
+        self.pending = []
+        self.changelog_futures = []
+        self.downloaded_files = []
+        self.targets = TargetClaims()
+        self.slots = threading.BoundedSemaphore(max(1, CONFIG.concurrency["downloads"]) * 2)
+        self.resolve_q = queue.Queue(maxsize=PIPELINE_QUEUE)
+        self.transfer_q = queue.Queue(maxsize=PIPELINE_QUEUE)
+        self.changelogs = ThreadPoolExecutor(max_workers=1, thread_name_prefix="txt")
+        self.transfer = BatchStage("transfer", self.transfer_q, self.transfer_batch, LINK_BATCH_MAX)
+        self.resolve = BatchStage("resolve", self.resolve_q, self.resolve_batch, LINK_BATCH_MAX,
+                                  on_end=lambda: self.transfer_q.put(_END))
+        self.transfer.start()
+        self.resolve.start()
+
+    def feed(self, f):
+        if STATE.is_unchanged(f):
+            print(f" • 未变化，跳过: {f.get('file_name', '?')}")
+            return
+        with self.lock:
+            self.changed += 1
+            first, self.probed = not self.probed, True
+        if first:
+            test_personal_drive()
+        if get_cookie():
+            self.resolve_q.put(f)
+        else:
+            self.dispatch(f, ([], ""))
+
+    def resolve_batch(self, files):
+        links, failed = resolve_share_links(files)
+        for f in files:
+            if f.get("fid", "") in links:
+                self.dispatch(f, links[f.get("fid", "")])
+        for f in failed:
+            self.transfer_q.put(f)
+
+    def transfer_batch(self, files):
+        links = resolve_transfer_links(files)
+        for f in files:
+            self.dispatch(f, links.get(f.get("fid", ""), ([], "")))
+
+    def dispatch(self, f, link):
+        if f.get("file_name", "").lower().endswith(".txt"):
+            edition = CONFIG.editions.get(f.get("_edition"))
+            fut = self.changelogs.submit(process_txt, f, edition.label if edition else None, link, self.downloaded_files)
+            with self.lock:
+                self.changelog_futures.append((f, fut))
+            return
+        self.slots.acquire()
+        try:
+            f, fut = submit_apk(f, link, self.targets)
+        except Exception:
+            self.slots.release()
+            raise
+        if fut is None:
+            self.slots.release()
+            return
+        fut.add_done_callback(lambda _: self.slots.release())
+        with self.lock:
+            self.pending.append((f, fut))
+
+    def close(self):
+        self.resolve_q.put(_END)
+
+    # 等待解析与转存阶段结束、更新日志全部写完；返回已提交的 APK 下载 [(文件, future)]
+    def join(self):
+        self.resolve.join()
+        self.transfer.join()
+        self.changelogs.shutdown(wait=True)
+        for f, fut in self.changelog_futures:
+            try:
+                fut.result()
+            except Exception as e:
+                print(f" TXT 处理异常 {f.get('file_name', '?')}: {str(e)}")
+        return self.pending
+
+# editions: 要处理的版本 id，默认为配置中的全部版本；所有版本共用列表线程池和下载调度器
+def run_once(incremental=True, editions=None):
+    editions = [CONFIG.editions[e] for e in (editions or CONFIG.editions)]
+    reclaim_leftover_transfers()
+    requeued = STATE.forget(MANIFEST.unpublished_missing())
+    if requeued:
+        print(f"{requeued} 个资产上次未确认发布且本地已不存在，本轮重新下载")
+
+    # 各版本按各自的选取策略并发列出；每页中新增或变化的文件立即进入流水线，与后续列表请求重叠执行
     print("\n" + "="*70)
-    print("=== 第二阶段：处理 OK Pro 版（全部文件） ===")
+    print(f"=== 列表阶段：{' / '.join(f'{e.label}（{e.select}）' for e in editions)} ===")
     print("="*70 + "\n")
-    apks_pro, txts_pro = get_apks_in_dir(TARGET_DIRS[0], is_pro=True)
-    for f in txts_pro:
-        name = f.get("file_name", "?")
-        size = f.get("size", 0)
-        fid = f.get("fid", "")
-        sft = f.get("share_fid_token", "")
-        print(f" • TXT: {name:<50} {size:>12,} B")
-        urls, ck = get_original_download(fid, sft, name, size, is_txt=True)
-        if urls:
-            downloaded_files.append(f"Version-Pro.txt (from {name})")
-    for f in apks_pro:
-        name = f.get("file_name", "?")
-        size = f.get("size", 0)
-        fid = f.get("fid", "")
-        sft = f.get("share_fid_token", "")
-        filename = name
-        for pattern, new_name in PRO_RENAME_MAP.items():
-            if re.search(pattern, name):
-                filename = new_name
-                break
-        if filename == name:
-            filename = name.replace(".apk", "").replace(" ", "_").replace("/", "_") + ".apk"
-        print(f" • {name:<50} {size:>12,} B → 将保存为: {filename}")
-        all_apks.append(f)
-        urls, ck = get_original_download(fid, sft, name, size)
+    pipeline = Pipeline()
+    scans = OrderedDict()
+    list_failed = []
+    workers = max(1, min(len(editions), CONFIG.concurrency["scans"]))
+    try:
+        with METRICS.span("scan"), ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dir") as dirs:
+            futures = [(e, dirs.submit(scan_edition, e, incremental, pipeline.feed)) for e in editions]
+            for e, fut in futures:
+                try:
+                    scans[e.id] = fut.result()
+                except ListingError as ex:
+                    # 已到达的页照常处理，但该版本本轮不记录目录指纹
+                    list_failed.append(e.label)
+                    print(f" [{e.label}] 列表失败，本轮不记录目录指纹: {str(ex)}")
+    finally:
+        pipeline.close()
+    if list_failed:
+        METRICS.incr("listing_failures", len(list_failed))
+    scanned = [(fps, apks + txts) for apks, txts, fps in scans.values()]
+
+    with METRICS.span("resolve_pipeline"):
+        pending = pipeline.join()
+    downloaded_files = pipeline.downloaded_files
+    changed = pipeline.changed > 0
+    METRICS.incr("files_changed", pipeline.changed)
+    write_github_output(changed="true" if changed else "false")
+    if not changed:
+        commit_fingerprints(scanned)
+        CLEANER.drain()
+        if list_failed:
+            print(f"\n{' / '.join(list_failed)} 列表失败，无法确认是否有变化")
+            return LIST_FAILED_EXIT_CODE
+        print("\n所有文件与上次运行一致，无需下载")
+        stage_release()
+        return NOOP_EXIT_CODE
+
+    # 等待所有并发下载完成
+    print(f"\n等待 {len(pending)} 个下载任务完成（{CONFIG.concurrency['downloads']} 线程）...")
+    for f, fut in pending:
+        try:
+            with METRICS.span("wait_downloads"):
+                urls, ck = fut.result()
+        except Exception as e:
+            METRICS.incr("download_failures")
+            print(f" 下载任务异常 {f.get('file_name', '?')}: {str(e)}")
+            continue
         if urls:
-            download_results.append({
-                "name": name,
-                "size": size,
-                "fid": fid,
-                "urls": urls,
-                "cookies": ck
-            })
-            print(f" → 处理完成 ({len(urls)} 条链接)")
-
-    # 保存结果
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    with open(f"apks_{ts}.json", "w", encoding="utf-8") as f:
-        json.dump(all_apks, f, ensure_ascii=False, indent=2)
-    print(f"\n已保存 APK 列表到 apks_{ts}.json")
-
-    if download_results:
-        with open(f"downloads_{ts}.json", "w", encoding="utf-8") as f:
-            json.dump(download_results, f, ensure_ascii=False, indent=2)
-        print(f"已保存 {len(download_results)} 条下载信息到 downloads_{ts}.json")
+            print(f" → 处理完成 {f.get('file_name', '?')} ({len(urls)} 条链接)")
+
+    # 本轮没有新 TXT 的版本也从日志库重新生成 Version 文件，供 Release 使用
+    for edition in editions:
+        store = changelog_store(edition.label)
+        if store.latest(1) and not os.path.exists(f"Version-{edition.label}.txt"):
+            store.render(f"Version-{edition.label}.txt")
+            downloaded_files.append(f"Version-{edition.label}.txt (日志库)")
+        if os.path.exists(f"Version-{edition.label}.txt"):
+            latest = store.latest(1)
+            MANIFEST.record_file(f"Version-{edition.label}.txt", edition.label, latest[0]["version"] if latest else "")
 
     print("\n已生成版本信息文件：")
     for df in set(downloaded_files):
@@ -599,8 +2434,109 @@ def main():
     print(os.listdir('.'))
     print("\n如果看到 Version-OK.txt / Version-Pro.txt，则已成功生成，可用于 Release")
 
+    commit_fingerprints(scanned)
+
+    count = MANIFEST.write_checksums()
+    if count:
+        print(f"已写入 {count} 个文件的校验和到 {CHECKSUM_FILE}")
+    stage_release()
+
     print("\n开始清理转存文件...")
     cleanup_transferred_files()
+    print(f"链接缓存统计: {FILES_CACHE.summary()}")
+    if list_failed:
+        print(f"{' / '.join(list_failed)} 列表失败，本轮结果不完整")
+        return LIST_FAILED_EXIT_CODE
+    return 0
+
+# 汇总缓存命中等状态量并导出运行报告
+def write_run_report(json_path=METRICS_JSON, prom_path=METRICS_PROM):
+    for key, value in FILES_CACHE.stats.items():
+        METRICS.gauge("link_cache", value, stat=key)
+    try:
+        METRICS.export(json_path, prom_path)
+    except OSError as e:
+        print(f"写入运行报告失败: {str(e)}")
+        return
+    if json_path:
+        print(f"运行报告已写入 {json_path}")
+
+# ===== 守护模式 =====
+STOP_EVENT = threading.Event()
+
+def jittered(interval):
+    return max(1.0, interval * random.uniform(1 - DAEMON_JITTER, 1 + DAEMON_JITTER))
+
+# 常驻进程：复用 stoken、连接池和各类缓存，按各版本的间隔轮询，收到 SIGINT/SIGTERM 后在本轮结束时退出
+def run_daemon(incremental=True, report_paths=(METRICS_JSON, METRICS_PROM)):
+    def stop(signum, frame):
+        print(f"\n收到信号 {signum}，本轮结束后退出")
+        STOP_EVENT.set()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    next_due = {e: 0.0 for e in CONFIG.editions}
+    cycle = 0
+    while not STOP_EVENT.is_set():
+        now = time.monotonic()
+        due = [e for e, t in next_due.items() if t <= now]
+        if due:
+            cycle += 1
+            print(f"\n=== 守护模式第 {cycle} 轮: {', '.join(due)} ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')}) ===")
+            try:
+                run_once(incremental, due)
+            except Exception as e:
+                METRICS.incr("cycle_failures")
+                print(f"本轮执行异常: {str(e)}")
+            write_run_report(*report_paths)
+            for e in due:
+                next_due[e] = time.monotonic() + jittered(CONFIG.editions[e].interval)
+        wait = max(0.0, min(next_due.values()) - time.monotonic())
+        print(f"下一次检查在 {wait:.0f} 秒后")
+        STOP_EVENT.wait(wait)
+    print("守护模式已停止")
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="监控夸克分享目录并下载最新 APK / 更新日志")
+    parser.add_argument("--full", action="store_true", help="忽略目录指纹，完整扫描所有目录")
+    parser.add_argument("--daemon", action="store_true", help="常驻运行，按 DAEMON_INTERVAL 轮询")
+    parser.add_argument("--config", default=MONITOR_CONFIG, help="监控配置 JSON 路径，不存在时使用内置默认配置")
+    parser.add_argument("--metrics-json", default=METRICS_JSON, help="运行报告 JSON 路径，留空则不写")
+    parser.add_argument("--metrics-prom", default=METRICS_PROM, help="Prometheus 文本格式指标路径（可选）")
+    parser.add_argument("--ack-release", action="store_true", help=f"确认 {RELEASE_DIR}/ 中的资产已上传，之后不再重复发布")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global MONITOR_CONFIG
+    args = parse_args(argv)
+    MONITOR_CONFIG = args.config
+    if args.ack_release:
+        print(f"已确认发布 {MANIFEST.ack()} 个资产")
+        return 0
+    try:
+        editions = CONFIG.editions
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ 监控配置无效 ({args.config}): {str(e)}")
+        return 2
+    print_debug_info()
+    shares = list(OrderedDict.fromkeys(e.pwd_id for e in editions.values()))
+    missing = [p for p in shares if not get_stoken(p)]
+    if len(missing) == len(shares):
+        print("❌ 缺少有效 stoken，无法继续")
+        return 1
+    for p in missing:
+        print(f"⚠️ 分享 {p} 无法获取 stoken，其目录将无法列出")
+    report_paths = (args.metrics_json, args.metrics_prom)
+    try:
+        if args.daemon:
+            return run_daemon(not args.full, report_paths)
+        return run_once(not args.full)
+    finally:
+        SCHEDULER.shutdown()
+        if not args.daemon:
+            write_run_report(*report_paths)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
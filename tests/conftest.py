@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRIPT = os.path.join(ROOT, "monitor_worker.py")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import monitor_worker as mw  # noqa: E402
+from fake_quark import MB, FakeQuark  # noqa: E402
+
+SIZE = 3 * MB + 123  # 单文件场景的 APK 大小，按 1 MB 分段时有 4 段
+FID = "pro00000"
+
+
+def start_fake(scenario="baseline", **overrides):
+    fake = FakeQuark(scenario, latency=0.0, **overrides)
+    fake.url = fake.start()
+    return fake
+
+
+# 标准目录结构（Pro 4 个 + 标准版 3 个 APK，各带一个 TXT）
+@pytest.fixture
+def fake():
+    fake = start_fake()
+    yield fake
+    fake.stop()
+
+
+# 只有一个 APK 的分享，供进程内直接调用下载 / 转存函数
+@pytest.fixture
+def single_fake():
+    fake = start_fake({"pro": [("OK影视Pro-电视版-64位-1.0.apk", SIZE)], "ok": []})
+    yield fake
+    fake.stop()
+
+
+# 把模块级客户端、状态对象指向替身服务和临时目录，用于进程内调用
+@pytest.fixture
+def engine(single_fake, tmp_path, monkeypatch):
+    fake = single_fake
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("QUARK_COOKIE", "bench=1")
+    monkeypatch.setattr(mw, "DRIVE_API", fake.url)
+    monkeypatch.setattr(mw, "DRIVE_PC_API", fake.url)
+    monkeypatch.setattr(mw, "PROGRESS", "off")
+    monkeypatch.setattr(mw, "SEGMENT_SIZE", MB)
+    monkeypatch.setattr(mw, "SEGMENT_MIN_SIZE", MB)
+    monkeypatch.setattr(mw, "get_stoken", lambda pwd_id=mw.PWD_ID: fake.stoken)
+    monkeypatch.setattr(mw, "ARTIFACTS", mw.ArtifactStore(str(tmp_path / "blobs"), str(tmp_path / "artifacts.json")))
+    monkeypatch.setattr(mw, "TRANSFERS", mw.TransferLedger(str(tmp_path / "transfers.json")))
+    return mw
+
+
+# 在 workdir 中以子进程运行脚本；返回 CompletedProcess，不检查退出码
+def run_script(fake, workdir, *args, **env_overrides):
+    env = dict(os.environ)
+    env.update(fake.env(fake.url))
+    env.update({
+        "MONITOR_STATE_DIR": str(workdir / ".monitor_state"),
+        "ARTIFACT_DIR": str(workdir / ".artifacts"),
+        "GITHUB_OUTPUT": str(workdir / "github_output.txt"),
+        "DOWNLOAD_RATE": "0",
+        "PROGRESS": "off",
+    })
+    env.update(env_overrides)
+    return subprocess.run([sys.executable, SCRIPT, *args], cwd=workdir, env=env,
+                          capture_output=True, text=True, encoding="utf-8", timeout=180)
+
+
+def run_ok(fake, workdir, *args, **env_overrides):
+    proc = run_script(fake, workdir, *args, **env_overrides)
+    assert proc.returncode in (0, mw.NOOP_EXIT_CODE), proc.stdout[-3000:] + proc.stderr[-3000:]
+    return proc
+
+
+def load_state(workdir, name):
+    with open(workdir / ".monitor_state" / name, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def apks(workdir):
+    return sorted(n for n in os.listdir(workdir) if n.endswith(".apk"))
@@ -0,0 +1,74 @@
+"""产物库：下载过程中流式计算 sha256（乱序分段缓冲、超限后从文件补算），内容寻址存储、复用与旧内容清理"""
+import hashlib
+import os
+
+import monitor_worker as mw
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_hasher_in_order(tmp_path):
+    data = bytes(range(256)) * 100
+    h = mw.StreamingHasher()
+    for i in range(0, len(data), 1000):
+        h.feed(i, memoryview(data)[i:i + 1000])
+    assert h.finish(str(tmp_path / "unused"), len(data)) == sha256(data)
+
+
+def test_hasher_out_of_order_buffers_until_contiguous(tmp_path):
+    data = bytes(range(256)) * 100
+    blocks = [(i, data[i:i + 3000]) for i in range(0, len(data), 3000)]
+    h = mw.StreamingHasher()
+    for offset, block in reversed(blocks):
+        h.feed(offset, bytearray(block))
+    assert not h.spilled
+    assert h.finish(str(tmp_path / "unused"), len(data)) == sha256(data)
+
+
+def test_hasher_reads_rest_from_file_after_spill(tmp_path):
+    data = bytes(range(256)) * 100
+    path = tmp_path / "body"
+    path.write_bytes(data)
+    h = mw.StreamingHasher(buffer_limit=1000)
+    h.feed(0, data[:500])
+    h.feed(5000, data[5000:7000])  # 超出缓冲上限，放弃缓冲
+    h.feed(500, data[500:5000])
+    assert h.spilled
+    assert h.finish(str(path), len(data)) == sha256(data)
+
+
+def ingest(store, tmp_path, data, target, fid):
+    part = tmp_path / (target + ".part")
+    part.write_bytes(data)
+    store.ingest(str(part), sha256(data), len(data), target, fid, fid + ".apk")
+    return sha256(data)
+
+
+def test_identical_content_is_stored_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = mw.ArtifactStore(str(tmp_path / "art"), str(tmp_path / "artifacts.json"))
+    digest = ingest(store, tmp_path, b"same" * 100, "a.apk", "f1")
+    ingest(store, tmp_path, b"same" * 100, "b.apk", "f2")
+    assert os.path.exists(store.blob_path(digest))
+    assert (tmp_path / "a.apk").read_bytes() == (tmp_path / "b.apk").read_bytes() == b"same" * 100
+    assert store.is_current("a.apk", "f1", 400) and store.is_current("b.apk", "f2")
+    assert not store.is_current("a.apk", "f2")
+
+
+def test_replaced_content_is_pruned(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = mw.ArtifactStore(str(tmp_path / "art"), str(tmp_path / "artifacts.json"))
+    old = ingest(store, tmp_path, b"v1" * 100, "a.apk", "f1")
+    shared = ingest(store, tmp_path, b"v1" * 100, "keep.apk", "f3")
+    ingest(store, tmp_path, b"v2" * 100, "a.apk", "f2")
+    assert os.path.exists(store.blob_path(shared))  # 仍被 keep.apk 引用
+
+    ingest(store, tmp_path, b"v3" * 100, "keep.apk", "f4")
+    assert not os.path.exists(store.blob_path(old))
+    assert not store.source("f1") and not store.source("f3")
+    assert store.is_current("a.apk", "f2")
+
+    reloaded = mw.ArtifactStore(str(tmp_path / "art"), str(tmp_path / "artifacts.json"))
+    assert reloaded.is_current("a.apk", "f2") and reloaded.is_current("keep.apk", "f4")
@@ -0,0 +1,63 @@
+"""更新日志库：同一版本去重、按版本号排序（与写入顺序无关）、超限压缩掉最旧的版本"""
+import monitor_worker as mw
+
+
+def store(tmp_path, **kwargs):
+    return mw.ChangelogStore(str(tmp_path / "state" / "changelog-Pro.jsonl"), **kwargs)
+
+
+def versions(entries):
+    return [e["version"] for e in entries]
+
+
+def test_same_version_is_recorded_once(tmp_path):
+    s = store(tmp_path)
+    assert s.add("v1.0", "- 修复", "a.txt")
+    assert not s.add("v1.0", "- 修复", "a.txt")
+    assert not s.add("1.0", "- 修复", "a.txt")  # v 前缀不影响版本号
+    assert s.add("v1.0", "- 修复\n- 新增", "a.txt")
+    assert len(s.latest()) == 1 and s.latest()[0]["changelog"] == "- 修复\n- 新增"
+
+    reloaded = store(tmp_path)
+    assert len(reloaded.latest()) == 1 and reloaded.latest()[0]["changelog"] == "- 修复\n- 新增"
+
+
+def test_latest_orders_by_version_not_insertion(tmp_path):
+    s = store(tmp_path)
+    s.add("v3.10.0", "c", updated_at=3)
+    s.add("v3.9.1", "b", updated_at=2)
+    s.add("v3.2", "a", updated_at=1)
+    assert versions(s.latest()) == ["v3.10.0", "v3.9.1", "v3.2"]
+
+    s.add("v3.2", "a（修订）", updated_at=9)  # 修改旧版本的日志不会把它排到最前
+    assert versions(s.latest()) == ["v3.10.0", "v3.9.1", "v3.2"]
+    assert versions(store(tmp_path).latest(2)) == ["v3.10.0", "v3.9.1"]
+
+
+def test_entries_without_version_fall_back_to_updated_at(tmp_path):
+    s = store(tmp_path)
+    s.add("未知版本", "新", updated_at=200)
+    s.add("未知版本", "旧", updated_at=100)
+    assert [e["changelog"] for e in s.latest()] == ["新", "旧"]
+
+
+def test_compaction_drops_lowest_versions(tmp_path):
+    s = store(tmp_path, max_entries=3)
+    for minor in (5, 1, 4, 2, 3, 0, 6):
+        s.add(f"v1.{minor}", f"log {minor}")
+    # 第 7 行超过 2 × max_entries，触发压缩
+    assert s.lines == 3
+    assert versions(s.latest()) == ["v1.6", "v1.5", "v1.4"]
+    with open(s.path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
+    assert versions(store(tmp_path, max_entries=3).latest()) == ["v1.6", "v1.5", "v1.4"]
+
+
+def test_render_writes_newest_first(tmp_path):
+    s = store(tmp_path)
+    s.add("v2.0", "二")
+    s.add("v10.0", "十")
+    out = tmp_path / "Version-Pro.txt"
+    assert s.render(str(out)) == 2
+    text = out.read_text(encoding="utf-8")
+    assert text.index("版本: v10.0") < text.index("版本: v2.0")
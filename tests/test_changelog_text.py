@@ -0,0 +1,35 @@
+"""更新日志 TXT：流式解码（UTF-8 跨块、BOM、GBK 回退、长度上限）与版本号 / 日志提取"""
+import pytest
+
+import monitor_worker as mw
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 4096])
+def test_decode_utf8_split_across_chunks(size):
+    text = "版本 v1.2.3\n更新日志:\n- 修复播放问题\n"
+    assert mw.decode_text_stream(chunked(text.encode("utf-8"), size)) == text
+
+
+def test_decode_utf8_bom():
+    text = "更新说明"
+    assert mw.decode_text_stream([b"\xef\xbb\xbf" + text.encode("utf-8")]).lstrip("﻿") == text
+
+
+def test_decode_gbk_falls_back():
+    text = "版本 v2.0.0 更新日志：优化启动速度"
+    assert mw.decode_text_stream(chunked(text.encode("gbk"), 5)) == text
+
+
+def test_decode_respects_limit():
+    assert mw.decode_text_stream([b"a" * 10, b"b" * 10], limit=15) == "a" * 10 + "b" * 5
+
+
+def test_parse_prefers_keyword_version():
+    text = "2024.05.01 发布\n版本 v1.2.3\n更新日志:\n- 修复播放问题，提升稳定性\n- 新增多线路切换与收藏同步功能\n"
+    version, changelog = mw.parse_version_and_changelog(text, "说明.txt")
+    assert version.lstrip("vV") == "1.2.3"
+    assert changelog.startswith("- 修复播放问题")
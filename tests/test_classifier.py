@@ -0,0 +1,32 @@
+"""文件名分类：按规则表映射目标名、架构与所属版本（OK / Pro），第一条匹配的规则生效，未匹配的名称只做清理"""
+import pytest
+
+import monitor_worker as mw
+
+
+@pytest.mark.parametrize("name, target, arch", [
+    ("OK影视Pro-电视版-32位-1.0.apk", "leanback-armeabi_v7a-pro.apk", "armeabi_v7a"),
+    ("OK影视Pro-手机版-1.0.apk", "mobile-arm64_v8a-pro.apk", "arm64_v8a"),
+    ("OK影视Pro-手机版-1.0 - 模拟器.apk", "mobile-armeabi_v7a-pro.apk", "armeabi_v7a"),
+    ("海信专版-OK影视-3.2.apk", "hisense-tv-universal-ok.apk", "universal"),
+])
+def test_classifier_matches_rename_maps(name, target, arch):
+    classifier = mw.FilenameClassifier([("pro", mw.PRO_RENAME_MAP), ("ok", mw.OK_RENAME_MAP)])
+    c = classifier.classify(name)
+    assert (c.target, c.arch) == (target, arch)
+    assert classifier.target_name(name) == target
+
+
+def test_classifier_first_rule_wins_and_unmatched_is_sanitised():
+    classifier = mw.FilenameClassifier([("a", {r"x.*\.apk": "first-universal-a.apk"}),
+                                        ("b", {r"xy.*\.apk": "second-universal-b.apk"})])
+    assert classifier.classify("xyz.apk").edition == "a"
+    assert classifier.classify("其他 应用.apk") is None
+    assert classifier.target_name("其他 应用.apk") == "其他_应用.apk"
+
+
+def test_classifier_reports_edition():
+    classifier = mw.FilenameClassifier([("pro", mw.PRO_RENAME_MAP), ("ok", mw.OK_RENAME_MAP)])
+    assert classifier.edition_of("OK影视Pro-电视版-64位-1.1.apk") == "pro"
+    assert classifier.edition_of("OK影视-手机版-3.2.apk") == "ok"
+    assert classifier.edition_of("readme.apk") is None
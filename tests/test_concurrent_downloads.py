@@ -0,0 +1,31 @@
+"""同一目标的多个源文件：每轮只下载最新的源，不会并发写同一个 .part 和进度文件"""
+import os
+
+import pytest
+
+from conftest import SIZE, apks, load_state as state, run_ok as run, start_fake
+import monitor_worker as mw
+
+OLD = ("OK影视Pro-电视版-64位-1.0.apk", SIZE)
+NEW = ("OK影视Pro-电视版-64位-1.1.apk", SIZE + 4096)
+
+
+@pytest.mark.parametrize("listing", [[OLD, NEW], [NEW, OLD]], ids=["old-first", "new-first"])
+def test_sources_sharing_a_target_keep_the_newest(tmp_path, listing):
+    fake = start_fake({"pro": listing, "ok": []})
+    try:
+        run(fake, tmp_path, PER_HOST_LIMIT="4")
+    finally:
+        fake.stop()
+    target = "leanback-arm64_v8a-pro.apk"
+    assert apks(tmp_path) == [target]
+    assert os.path.getsize(tmp_path / target) == NEW[1]
+    mw.validate_apk(str(tmp_path / target))
+    assert not [n for n in os.listdir(tmp_path) if ".part" in n]
+
+    files = state(tmp_path, "files.json")["files"]
+    by_name = {e["name"]: e for e in files.values()}
+    assert not by_name[NEW[0]].get("superseded")
+    if listing[0] is NEW:
+        # 更旧的源在最新源登记之后才出现，不会被下载
+        assert by_name[OLD[0]]["superseded"]
@@ -0,0 +1,73 @@
+"""下载读写：pump 写入的是解码后的原始字节，文件请求不接受压缩编码"""
+import gzip
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import monitor_worker as mw
+from fake_quark import MB, body_slice
+
+BODY = body_slice(MB + 77, 0, MB + 76)
+
+
+# always_gzip 为 True 时无视 Accept-Encoding 一律返回 gzip（模拟不规范的服务器），否则仅在客户端接受时压缩
+def serve(always_gzip):
+    seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            accept = self.headers.get("Accept-Encoding", "")
+            seen.append(accept)
+            body = BODY
+            self.send_response(200)
+            self.send_header("Content-Type", "application/vnd.android.package-archive")
+            if always_gzip or "gzip" in accept:
+                body = gzip.compress(BODY)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/f/app.apk", seen
+
+
+@pytest.fixture
+def gzip_server():
+    server, url, seen = serve(always_gzip=True)
+    yield url, seen
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def polite_server():
+    server, url, seen = serve(always_gzip=False)
+    yield url, seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_pump_decodes_compressed_body(gzip_server):
+    url, _ = gzip_server
+    out = bytearray()
+    with mw.CLIENT.get(url, "file", stream=True) as r:
+        received = mw.pump(r, lambda view, offset: out.extend(view), mw.Progress("t", 0, enabled=False))
+    assert bytes(out) == BODY and received == len(BODY)
+
+
+def test_file_requests_ask_for_identity_encoding(engine, polite_server, tmp_path):
+    url, seen = polite_server
+    digest = engine.download_file(url, engine.get_headers(), "app.apk", len(BODY))
+    assert seen and all(accept == "identity" for accept in seen)
+    assert (tmp_path / "app.apk").read_bytes() == BODY
+    assert digest == hashlib.sha256(BODY).hexdigest()
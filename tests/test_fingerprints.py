@@ -0,0 +1,49 @@
+"""目录指纹：未变化时跳过并以 NOOP_EXIT_CODE 退出；列表失败或只列出部分页时不记录指纹、不报告无变化"""
+from conftest import apks, load_state as state, run_ok, run_script, start_fake
+import monitor_worker as mw
+from fake_quark import OK_DIR, PRO_DIR
+
+FAST_RETRY = {"HTTP_RETRIES": "1", "HTTP_BACKOFF": "0"}
+
+
+def read_output(workdir):
+    with open(workdir / "github_output.txt", encoding="utf-8") as f:
+        return dict(line.strip().split("=", 1) for line in f if "=" in line)
+
+
+def test_unchanged_listing_is_skipped_with_noop_exit(fake, tmp_path):
+    first = run_ok(fake, tmp_path)
+    assert first.returncode == 0
+    assert set(state(tmp_path, "files.json")["dirs"]) >= {PRO_DIR, OK_DIR}
+
+    fake.reset_stats()
+    second = run_script(fake, tmp_path)
+    assert second.returncode == mw.NOOP_EXIT_CODE
+    assert "指纹未变化" in second.stdout
+    assert fake.stats["requests"].get("file", 0) == 0
+
+
+def test_failed_listing_is_not_fingerprinted(tmp_path):
+    fake = start_fake({"pro": [], "ok": []})
+    fake.broken_pages.add((PRO_DIR, 1))
+    try:
+        proc = run_script(fake, tmp_path, **FAST_RETRY)
+    finally:
+        fake.stop()
+    assert proc.returncode not in (0, mw.NOOP_EXIT_CODE)
+    assert read_output(tmp_path).get("changed") == "false"
+    assert PRO_DIR not in state(tmp_path, "files.json")["dirs"]
+
+
+def test_failed_middle_page_is_not_fingerprinted(tmp_path):
+    fake = start_fake("deep-pagination")
+    fake.broken_pages.add((PRO_DIR, 3))
+    try:
+        proc = run_script(fake, tmp_path, **FAST_RETRY)
+    finally:
+        fake.stop()
+    assert proc.returncode not in (0, mw.NOOP_EXIT_CODE)
+    dirs = state(tmp_path, "files.json")["dirs"]
+    assert PRO_DIR not in dirs and OK_DIR in dirs
+    # 其余版本和已到达的页照常处理
+    assert len(apks(tmp_path)) == 7
@@ -0,0 +1,96 @@
+"""HTTP 客户端：指数退避 + 抖动、遵循 Retry-After（秒数或 HTTP 日期，均有上限），非幂等接口只在 429 时重试"""
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+import monitor_worker as mw
+
+
+def response(retry_after=None):
+    return SimpleNamespace(headers={"Retry-After": retry_after} if retry_after is not None else {})
+
+
+def test_retry_after_seconds_and_cap():
+    assert mw.QuarkClient._retry_after(response("2")) == 2.0
+    assert mw.QuarkClient._retry_after(response("-5")) == 0.0
+    assert mw.QuarkClient._retry_after(response("86400")) == mw.HTTP_BACKOFF_MAX
+    assert mw.QuarkClient._retry_after(response()) is None
+    assert mw.QuarkClient._retry_after(response("soon")) is None
+
+
+def test_retry_after_http_date():
+    when = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=10), usegmt=True)
+    assert 8 <= mw.QuarkClient._retry_after(response(when)) <= 10
+
+
+def test_backoff_grows_with_jitter_and_is_capped():
+    client = mw.QuarkClient(backoff=1.0)
+    for attempt in range(4):
+        delay = client._backoff(attempt)
+        assert 2 ** attempt / 2 <= delay <= 2 ** attempt
+    assert client._backoff(20) <= mw.HTTP_BACKOFF_MAX
+
+
+# 按顺序返回 statuses 中的状态码（用完后返回 200），记录收到的请求数
+@pytest.fixture
+def scripted(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(mw.time, "sleep", sleeps.append)
+    state = {"statuses": [], "hits": 0, "retry_after": None}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            state["hits"] += 1
+            status = state["statuses"].pop(0) if state["statuses"] else 200
+            self.send_response(status)
+            if status != 200 and state["retry_after"]:
+                self.send_header("Retry-After", state["retry_after"])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        do_GET = do_POST = reply
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state["url"] = f"http://127.0.0.1:{server.server_address[1]}/api"
+    state["sleeps"] = sleeps
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def test_retry_after_is_honoured(scripted):
+    scripted["statuses"] = [503, 503]
+    scripted["retry_after"] = "3"
+    r = mw.QuarkClient(retries=3, backoff=0.01).get(scripted["url"], "list")
+    assert r.status_code == 200 and scripted["hits"] == 3
+    assert scripted["sleeps"] == [3.0, 3.0]
+
+
+def test_gives_up_after_retries(scripted):
+    scripted["statuses"] = [503] * 5
+    r = mw.QuarkClient(retries=2, backoff=0.01).get(scripted["url"], "list")
+    assert r.status_code == 503 and scripted["hits"] == 3
+    assert len(scripted["sleeps"]) == 2 and all(d <= 0.02 for d in scripted["sleeps"])
+
+
+def test_non_idempotent_retries_only_429(scripted):
+    client = mw.QuarkClient(retries=3, backoff=0.01)
+    scripted["statuses"] = [503]
+    assert client.post(scripted["url"], "save", idempotent=False).status_code == 503
+    assert scripted["hits"] == 1
+
+    scripted["statuses"] = [429]
+    assert client.post(scripted["url"], "save", idempotent=False).status_code == 200
+    assert scripted["hits"] == 3
@@ -0,0 +1,75 @@
+"""下载链接缓存：TTL 过期、LRU 淘汰、命中计数与跨运行持久化；缓存的链接失效时丢弃并重新解析"""
+import json
+import os
+
+from conftest import apks, load_state as state, run_ok as run
+import monitor_worker as mw
+
+
+def cache(tmp_path, **kwargs):
+    return mw.LinkCache(str(tmp_path / "links.json"), **kwargs)
+
+
+def test_hit_and_miss_are_counted(tmp_path):
+    c = cache(tmp_path)
+    assert c.get("a") is None
+    c.put("a", ["http://cdn/a"], "k=v", local_fid="L_a")
+    entry = c.get("a")
+    assert entry["ori_urls"] == ["http://cdn/a"] and entry["cookies"] == "k=v" and entry["local_fid"] == "L_a"
+    assert c.stats == {"hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_expired_entries_are_evicted(tmp_path, monkeypatch):
+    c = cache(tmp_path, ttl=60)
+    c.put("a", ["http://cdn/a"])
+    now = mw.time.time()
+    monkeypatch.setattr(mw.time, "time", lambda: now + 61)
+    assert c.get("a") is None
+    assert c.stats["evictions"] == 1 and c.stats["misses"] == 1
+
+
+def test_expired_entries_are_dropped_on_load(tmp_path):
+    c = cache(tmp_path, ttl=-1)
+    c.put("a", ["http://cdn/a"])
+    reloaded = cache(tmp_path)
+    assert reloaded.items() == [] and reloaded.stats["evictions"] == 1
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    c = cache(tmp_path, max_entries=2)
+    c.put("a", ["http://cdn/a"])
+    c.put("b", ["http://cdn/b"])
+    assert c.get("a")  # a 变为最近使用
+    c.put("c", ["http://cdn/c"])
+    assert [k for k, _ in c.items()] == ["a", "c"]
+    assert c.stats["evictions"] == 1
+    assert [k for k, _ in cache(tmp_path).items()] == ["a", "c"]
+
+
+def test_discard_local_drops_links_to_deleted_copies(tmp_path):
+    c = cache(tmp_path)
+    c.put("a", ["http://cdn/a"], local_fid="L_a")
+    c.put("b", ["http://cdn/b"])
+    c.discard_local(["L_a"])
+    assert [k for k, _ in c.items()] == ["b"]
+    c.discard("b")
+    assert cache(tmp_path).items() == []
+
+
+def test_dead_cached_links_are_dropped_and_re_resolved(fake, tmp_path):
+    run(fake, tmp_path)
+    assert len(apks(tmp_path)) == 7
+
+    links = state(tmp_path, "links.json")
+    for entry in links["entries"].values():
+        entry["ori_urls"] = [f"{fake.url}/f/dead"]
+    with open(tmp_path / ".monitor_state" / "links.json", "w", encoding="utf-8") as f:
+        json.dump(links, f)
+    os.remove(tmp_path / ".monitor_state" / "files.json")
+    for name in apks(tmp_path):
+        os.remove(tmp_path / name)
+
+    run(fake, tmp_path)
+    assert len(apks(tmp_path)) == 7
+    urls = [u for e in state(tmp_path, "links.json")["entries"].values() for u in e["ori_urls"]]
+    assert urls and not any(u.endswith("/f/dead") for u in urls)
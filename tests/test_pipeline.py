@@ -0,0 +1,88 @@
+"""流水线背压：下载池排队数受 slots 限制、阶段间队列有界，下游跟不上时列表线程阻塞而不是无限堆积"""
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import monitor_worker as mw
+
+
+def apk(i):
+    return {"fid": f"f{i:03d}", "file_name": f"插件-{i:03d}.apk", "size": 1000 + i, "file_type": 1, "updated_at": i}
+
+
+@pytest.fixture
+def pipeline_env(tmp_path, monkeypatch):
+    monkeypatch.setattr(mw, "STATE", mw.StateStore(str(tmp_path / "files.json")))
+    monkeypatch.setattr(mw, "test_personal_drive", lambda: None)
+    monkeypatch.setitem(mw.CONFIG.concurrency, "downloads", 2)
+
+
+# 在后台线程中依次 feed，返回 (线程, 已送入的个数)
+def start_feeding(pipeline, files):
+    fed = []
+
+    def run():
+        for f in files:
+            pipeline.feed(f)
+            fed.append(f)
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    return t, fed
+
+
+def test_download_slots_block_the_feeder(pipeline_env, monkeypatch):
+    monkeypatch.setattr(mw, "get_cookie", lambda: "")
+    submitted = []
+
+    def submit(f, link, claims):
+        fut = Future()
+        submitted.append(fut)
+        return f, fut
+
+    monkeypatch.setattr(mw, "submit_apk", submit)
+    pipeline = mw.Pipeline()
+    feeder, fed = start_feeding(pipeline, [apk(i) for i in range(10)])
+    time.sleep(0.5)
+    assert feeder.is_alive()
+    assert len(submitted) == 4  # 2 个下载线程 × 2
+
+    for _ in range(10):
+        for fut in list(submitted):
+            if not fut.done():
+                fut.set_result(([], ""))
+        time.sleep(0.05)
+    feeder.join(5)
+    assert not feeder.is_alive() and len(fed) == len(submitted) == 10
+    pipeline.close()
+    assert len(pipeline.join()) == 10
+
+
+def test_bounded_resolve_queue_blocks_the_feeder(pipeline_env, monkeypatch):
+    monkeypatch.setattr(mw, "get_cookie", lambda: "k=v")
+    monkeypatch.setattr(mw, "PIPELINE_QUEUE", 2)
+    release = threading.Event()
+    batches = []
+
+    def resolve(files):
+        batches.append(len(files))
+        release.wait(5)
+        return {}, []
+
+    monkeypatch.setattr(mw, "resolve_share_links", resolve)
+    pipeline = mw.Pipeline()
+    total = mw.LINK_BATCH_MAX + 20
+    feeder, fed = start_feeding(pipeline, [apk(i) for i in range(total)])
+    time.sleep(mw.PIPELINE_LINGER + 0.5)
+    assert feeder.is_alive()
+    assert len(fed) <= sum(batches) + 2  # 处理中的批次 + 队列容量
+    assert len(fed) < total
+
+    release.set()
+    feeder.join(5)
+    assert not feeder.is_alive() and len(fed) == total
+    pipeline.close()
+    pipeline.join()
+    assert sum(batches) == total
@@ -0,0 +1,82 @@
+"""发布清单：只把与上次确认发布不同的资产放入 release/，--ack-release 确认后不再重复；未确认且本地已丢失的资产重新下载"""
+import hashlib
+import json
+import os
+
+from conftest import apks, load_state as state, run_ok as run, run_script
+import monitor_worker as mw
+
+
+def manifest(tmp_path):
+    return mw.ReleaseManifest(str(tmp_path / "state" / "release.json"))
+
+
+def write(tmp_path, name, data):
+    (tmp_path / name).write_bytes(data)
+    return hashlib.sha256(data).hexdigest()
+
+
+def record(m, tmp_path, name, data, fid):
+    m.record(name, edition="Pro", arch="arm64_v8a", size=len(data), sha256=write(tmp_path, name, data),
+             version="1.0", fid=fid)
+
+
+def test_stage_and_ack(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    m = manifest(tmp_path)
+    record(m, tmp_path, "a.apk", b"a1", "fa")
+    record(m, tmp_path, "b.apk", b"b1", "fb")
+    assert m.stage("release") == ["a.apk", "b.apk"]
+    assert sorted(os.listdir("release")) == sorted(["a.apk", "b.apk", mw.CHECKSUM_FILE, mw.RELEASE_MANIFEST])
+    with open(os.path.join("release", mw.RELEASE_MANIFEST), encoding="utf-8") as f:
+        assert [a["target"] for a in json.load(f)["assets"]] == ["a.apk", "b.apk"]
+
+    assert manifest(tmp_path).ack() == 2  # 已暂存的摘要持久化，另一个进程也能确认
+    m = manifest(tmp_path)
+    assert m.stage("release") == [] and not os.path.exists("release")
+
+    record(m, tmp_path, "b.apk", b"b2", "fb2")
+    assert m.stage("release") == ["b.apk"]
+    assert sorted(os.listdir("release")) == sorted(["b.apk", mw.CHECKSUM_FILE, mw.RELEASE_MANIFEST])
+
+
+def test_unstaged_changes_are_staged_again_until_acked(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    m = manifest(tmp_path)
+    record(m, tmp_path, "a.apk", b"a1", "fa")
+    assert m.stage("release") == ["a.apk"]
+    assert manifest(tmp_path).stage("release") == ["a.apk"]  # 上传失败未确认，下次仍放入
+
+
+def test_unpublished_missing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    m = manifest(tmp_path)
+    record(m, tmp_path, "a.apk", b"a1", "fa")
+    record(m, tmp_path, "b.apk", b"b1", "fb")
+    m.stage("release")
+    m.ack()
+    record(m, tmp_path, "c.apk", b"c1", "fc")
+    m.record("Version-Pro.txt", edition="Pro", arch="", size=1, sha256="x", version="", fid="")
+    for name in ("a.apk", "c.apk"):
+        os.remove(name)
+    assert m.unpublished_missing() == ["fc"]  # a 已发布、TXT 没有源 fid，都不需要重新下载
+
+
+def test_release_flow_end_to_end(fake, tmp_path):
+    run(fake, tmp_path)
+    assert "release=true" in (tmp_path / "github_output.txt").read_text(encoding="utf-8")
+    staged = sorted(n for n in os.listdir(tmp_path / "release") if n.endswith(".apk"))
+    assert staged == apks(tmp_path) and len(staged) == 7
+
+    # 上传失败（未确认），工作目录是新的：APK 重新下载并再次放入 release/
+    for name in apks(tmp_path):
+        os.remove(tmp_path / name)
+    run(fake, tmp_path)
+    assert len(apks(tmp_path)) == 7
+    assert len([n for n in os.listdir(tmp_path / "release") if n.endswith(".apk")]) == 7
+
+    assert run_script(fake, tmp_path, "--ack-release").returncode == 0
+    assert not state(tmp_path, "release.json")["staged"]
+    (tmp_path / "github_output.txt").unlink()
+    assert run_script(fake, tmp_path).returncode == mw.NOOP_EXIT_CODE
+    assert "release=false" in (tmp_path / "github_output.txt").read_text(encoding="utf-8")
@@ -0,0 +1,45 @@
+"""分段下载与断点续传：同一源文件从进度文件继续，其他源（如同名目标的旧版本）留下的进度被忽略"""
+import hashlib
+import json
+
+from conftest import FID, SIZE
+from fake_quark import MB, body_slice
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def start_resume(tmp_path, part_bytes, sidecar):
+    (tmp_path / "a.apk.part").write_bytes(part_bytes)
+    (tmp_path / "a.apk.part.json").write_text(json.dumps(sidecar))
+
+
+def test_resume_continues_same_source(engine, single_fake, tmp_path):
+    fake = single_fake
+    expected = body_slice(SIZE, 0, SIZE - 1)
+    start_resume(tmp_path, expected[:MB] + b"\0" * (SIZE - MB),
+                 {"fid": FID, "size": SIZE, "segment": MB, "done": [0]})
+    fake.reset_stats()
+    digest = engine.download_file(f"{fake.url}/f/{FID}", {}, "a.apk", SIZE, FID)
+    assert digest == sha256(expected)
+    assert (tmp_path / "a.apk").read_bytes() == expected
+    assert fake.stats["bytes_served"] < SIZE  # 第 0 段没有重新下载
+
+
+def test_resume_ignores_progress_of_another_source(engine, single_fake, tmp_path):
+    fake = single_fake
+    expected = body_slice(SIZE, 0, SIZE - 1)
+    start_resume(tmp_path, b"\x55" * SIZE, {"fid": "old-version", "size": SIZE, "segment": MB, "done": [0, 1, 2, 3]})
+    digest = engine.download_file(f"{fake.url}/f/{FID}", {}, "a.apk", SIZE, FID)
+    assert digest == sha256(expected)
+    assert (tmp_path / "a.apk").read_bytes() == expected
+
+
+def test_segmented_download_without_progress(engine, single_fake, tmp_path):
+    fake = single_fake
+    expected = body_slice(SIZE, 0, SIZE - 1)
+    digest = engine.download_file(f"{fake.url}/f/{FID}", {}, "a.apk", SIZE, FID)
+    assert digest == sha256(expected)
+    assert (tmp_path / "a.apk").read_bytes() == expected
+    assert not (tmp_path / "a.apk.part").exists() and not (tmp_path / "a.apk.part.json").exists()
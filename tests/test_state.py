@@ -0,0 +1,41 @@
+"""逐文件状态：签名比较、原子写入，以及失败的更新日志 TXT 不会被记为完成"""
+import os
+
+import monitor_worker as mw
+from conftest import load_state, run_ok
+
+
+def test_state_store_signature_and_persistence(tmp_path):
+    path = str(tmp_path / "nested" / "files.json")
+    f = {"fid": "a", "file_name": "x.apk", "size": 10, "updated_at": 1}
+    store = mw.StateStore(path)
+    assert not store.is_unchanged(f)
+    store.mark_done(f, target="x.apk")
+
+    reloaded = mw.StateStore(path)
+    assert reloaded.is_unchanged(f)
+    assert not reloaded.is_unchanged(dict(f, updated_at=2))
+    assert not reloaded.is_unchanged(dict(f, size=11))
+
+
+def test_atomic_writes_create_directories_and_leave_no_temp_files(tmp_path):
+    mw.atomic_write_json(str(tmp_path / "a" / "b.json"), {"k": "值"})
+    mw.atomic_write_text(str(tmp_path / "a" / "c.txt"), "文本")
+    assert mw.load_json(str(tmp_path / "a" / "b.json"), None) == {"k": "值"}
+    assert (tmp_path / "a" / "c.txt").read_text(encoding="utf-8") == "文本"
+    assert sorted(os.listdir(tmp_path / "a")) == ["b.json", "c.txt"]
+
+
+def test_failed_changelog_is_retried_next_run_ok(fake, tmp_path):
+    txts = {fid for fid, f in fake.files.items() if f["file_name"].endswith(".txt")}
+    fake.broken.update(txts)
+    run_ok(fake, tmp_path)
+    done = load_state(tmp_path, "files.json")["files"]
+    assert len(done) == 7  # APK 全部完成
+    assert not txts & set(done)
+
+    fake.broken.clear()
+    run_ok(fake, tmp_path)  # 增量模式：目录指纹未提交，TXT 会被重新处理
+    assert txts <= set(load_state(tmp_path, "files.json")["files"])
+    for label in ("OK", "Pro"):
+        assert os.path.getsize(tmp_path / ".monitor_state" / f"changelog-{label}.jsonl") > 0
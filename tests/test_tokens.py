@@ -0,0 +1,70 @@
+"""stoken 生命周期：并发失败只刷新一次，失效时记录实际寿命，临近过期时提前刷新"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import monitor_worker as mw
+
+PWD = "share1"
+
+
+@pytest.fixture
+def tokens(tmp_path, monkeypatch):
+    manager = mw.TokenManager(str(tmp_path / "state" / "stoken.json"))
+    monkeypatch.setattr(mw, "TOKENS", manager)
+    calls = []
+
+    def fetch(pwd_id):
+        calls.append(pwd_id)
+        time.sleep(0.1)  # 刷新期间其他线程的失败调用都在等待同一把锁
+        return f"tok{len(calls)}"
+
+    monkeypatch.setattr(mw, "get_latest_stoken", fetch)
+    manager.calls = calls
+    return manager
+
+
+def reply(stoken, valid):
+    ok = stoken == valid
+    return SimpleNamespace(status_code=200 if ok else 401, json=lambda: {"code": 0 if ok else 401, "stoken": stoken})
+
+
+def test_concurrent_failures_refresh_once(tokens):
+    tokens.tokens[PWD] = {"stoken": "expired", "fetched_at": time.time() - 60, "lifetimes": []}
+    barrier = threading.Barrier(8)
+    results = []
+
+    def send(stoken):
+        if stoken == "expired":
+            barrier.wait(5)  # 8 个线程都先用失效的 stoken 请求
+        return reply(stoken, "tok1")
+
+    def worker():
+        r, data = mw.call_with_stoken(PWD, send)
+        results.append((r.status_code, data["stoken"]))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert tokens.calls == [PWD]
+    assert results == [(200, "tok1")] * 8
+    assert 50 <= tokens.tokens[PWD]["lifetimes"][0] <= 70
+
+    reloaded = mw.TokenManager(tokens.path)
+    assert reloaded.get(PWD) == "tok1"
+
+
+def test_expiring_token_is_refreshed_early(tokens, monkeypatch):
+    monkeypatch.setattr(mw, "STOKEN_MIN_TTL", 0)
+    monkeypatch.setattr(mw, "STOKEN_REFRESH_MARGIN", 0.2)
+    lifetimes = [100, 300, 200]
+    tokens.tokens[PWD] = {"stoken": "old", "fetched_at": time.time() - 150, "lifetimes": lifetimes}
+    assert mw.TokenManager.lifetime(tokens.tokens[PWD]) == 200
+    assert tokens.get(PWD) == "old" and not tokens.calls  # 150s < 200s × 0.8
+    tokens.tokens[PWD]["fetched_at"] = time.time() - 170
+    assert tokens.get(PWD) == "tok1"
+    assert tokens.tokens[PWD]["lifetimes"] == lifetimes  # 提前刷新不算失效，不记录寿命
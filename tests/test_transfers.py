@@ -0,0 +1,54 @@
+"""转存任务：轮询超时的任务下次运行回收其副本，未对应到源文件的副本也记入台账并最终删除"""
+import monitor_worker as mw
+from conftest import FID, load_state as state, run_ok as run, start_fake
+
+
+def test_ledger_persists_copies_and_tasks(tmp_path):
+    path = str(tmp_path / "transfers.json")
+    ledger = mw.TransferLedger(path)
+    ledger.add({"a": "L_a"})
+    ledger.add_unmapped(["L_x"])
+    ledger.add_task("t1")
+    assert ledger.take_leftovers() == []  # 本次运行登记的副本不是遗留副本
+
+    reloaded = mw.TransferLedger(path)
+    assert sorted(reloaded.take_leftovers()) == ["L_a", "L_x"]
+    assert reloaded.local_fids("a") == ["L_a"]
+    assert list(reloaded.pending_tasks()) == ["t1"]
+    reloaded.remove(["L_a", "L_x"])
+    reloaded.remove_task("t1")
+    assert mw.TransferLedger(path).local_fids() == [] and not mw.TransferLedger(path).pending_tasks()
+
+
+def test_timed_out_transfer_is_reclaimed_later(engine, single_fake, monkeypatch):
+    fake = single_fake
+    monkeypatch.setattr(mw, "TASK_TIMEOUT", 0.3)
+    monkeypatch.setattr(mw, "TASK_POLL_MIN", 0.05)
+    fake.task_rounds = 10 ** 6
+    assert engine.copy_files([(FID, "tk_" + FID)]) == {}
+    assert list(engine.TRANSFERS.pending_tasks())
+
+    fake.task_rounds = 0
+    assert engine.collect_timed_out_tasks() == ["L_" + FID]
+    assert engine.TRANSFERS.local_fids() == ["L_" + FID]
+    assert not engine.TRANSFERS.pending_tasks()
+
+
+def test_unmapped_transfer_copies_are_recorded(engine, single_fake):
+    fake = single_fake
+    fake.task_rounds = 0
+    fake.save_drop = 1
+    items = [(FID, "tk_" + FID), ("missing", "tk_missing")]
+    assert engine.copy_files(items) == {}
+    assert engine.TRANSFERS.local_fids() == ["L_" + FID]
+
+
+def test_unmapped_transfer_copies_are_deleted(tmp_path):
+    fake = start_fake(direct_fail=True, task_rounds=0, save_drop=1)
+    try:
+        run(fake, tmp_path)
+    finally:
+        fake.stop()
+    assert fake.deleted
+    assert all(lf.startswith("L_") and lf[2:] in fake.files for lf in fake.deleted)
+    assert state(tmp_path, "transfers.json")["entries"] == {}
@@ -0,0 +1,77 @@
+"""下载校验：APK（zip）结构检查、探测结果检查，不合格的文件移入隔离区"""
+import os
+import zipfile
+
+import pytest
+
+import monitor_worker as mw
+from fake_quark import body_slice
+
+
+def make_apk(path, comment=b""):
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("AndroidManifest.xml", b"<manifest/>" * 100)
+        z.writestr("classes.dex", b"dex\n" * 1000)
+        z.comment = comment
+
+
+def test_validate_apk_accepts_real_zip(tmp_path):
+    path = tmp_path / "ok.apk"
+    make_apk(path, comment=b"signed")
+    mw.validate_apk(str(path))
+
+
+def test_validate_apk_accepts_fake_server_body(tmp_path):
+    size = 200 * 1024
+    path = tmp_path / "fake.apk"
+    path.write_bytes(body_slice(size, 0, size - 1))
+    mw.validate_apk(str(path))
+
+
+def test_validate_apk_rejects_truncated(tmp_path):
+    path = tmp_path / "ok.apk"
+    make_apk(path)
+    data = path.read_bytes()
+    path.write_bytes(data[:len(data) - 30])
+    with pytest.raises(mw.IntegrityError):
+        mw.validate_apk(str(path))
+
+
+def test_validate_apk_rejects_html(tmp_path):
+    path = tmp_path / "err.apk"
+    path.write_bytes(b"<html><body>403 Forbidden</body></html>")
+    with pytest.raises(mw.IntegrityError):
+        mw.validate_apk(str(path))
+
+
+def test_validate_apk_rejects_central_directory_out_of_bounds(tmp_path):
+    path = tmp_path / "ok.apk"
+    make_apk(path)
+    data = bytearray(path.read_bytes())
+    eocd = data.rfind(b"PK\x05\x06")
+    data[eocd + 16:eocd + 20] = (len(data) + 100).to_bytes(4, "little")
+    path.write_bytes(bytes(data))
+    with pytest.raises(mw.IntegrityError):
+        mw.validate_apk(str(path))
+
+
+def test_check_probe_rejects_error_pages_and_size_mismatch():
+    mw.check_probe(1000, "application/vnd.android.package-archive", 1000)
+    mw.check_probe(None, "application/octet-stream", 1000)
+    with pytest.raises(mw.IntegrityError):
+        mw.check_probe(1000, "text/html", 1000)
+    with pytest.raises(mw.IntegrityError):
+        mw.check_probe(999, "application/octet-stream", 1000)
+
+
+def test_quarantine_keeps_latest(tmp_path, monkeypatch):
+    monkeypatch.setattr(mw, "QUARANTINE_DIR", str(tmp_path / "quarantine"))
+    monkeypatch.setattr(mw, "QUARANTINE_KEEP", 2)
+    for i in range(3):
+        part = tmp_path / f"a{i}.apk.part"
+        part.write_bytes(b"<html>")
+        mw.quarantine(str(part), f"a{i}.apk", "文件头不是 zip")
+        assert not part.exists()
+    kept = sorted(os.listdir(tmp_path / "quarantine"))
+    assert len([n for n in kept if not n.endswith(".json")]) == 2
+    assert all(n.endswith(("a1.apk", "a2.apk", "a1.apk.json", "a2.apk.json")) for n in kept)